@@ -22,6 +22,8 @@ from ._python       import (
     PyTesting
 )
 from .git           import version
+from ._scheduler    import Scheduler
+from ._profile      import Profiling
 
 def register(name:str, fcn:Callable[[Context], None], glob:dict):
     u"Registers a *build* command for building a single module"
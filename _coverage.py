@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+u"""
+Index of c++ object directories for coverage.
+
+The build stores the directories where objects are compiled. Coverage files
+(*.gcda*) are only looked for there, rather than by walking the whole build
+directory. Should the index be missing, the walk happens once and its result
+is stored.
+"""
+import json
+from   pathlib          import Path
+from   typing           import Iterable, List
+
+INDEX = "objectdirs.json"
+
+def _index(outdir) -> Path:
+    return Path(outdir)/"c4che"/INDEX
+
+def saveobjectdirs(outdir, dirs: Iterable):
+    "adds directories to the index"
+    path = _index(outdir)
+    old  = set(str(i) for i in objectdirs(outdir, walk = False))
+    new  = sorted(old | set(str(i) for i in dirs))
+    if new != sorted(old):
+        path.parent.mkdir(parents = True, exist_ok = True)
+        with open(path, 'w', encoding = 'utf-8') as stream:
+            json.dump(new, stream)
+
+def objectdirs(outdir, walk = True) -> List[Path]:
+    "returns the directories containing objects"
+    try:
+        with open(_index(outdir), 'r', encoding = 'utf-8') as stream:
+            return [Path(i) for i in json.load(stream) if Path(i).exists()]
+    except (OSError, ValueError, TypeError):
+        pass
+
+    if not walk:
+        return []
+    dirs = sorted({i.parent.resolve() for i in Path(outdir).glob("**/*.gcno")})
+    saveobjectdirs(outdir, dirs)
+    return dirs
+
+def gcdadirs(outdir) -> List[Path]:
+    "returns the object directories containing coverage data"
+    return [i for i in objectdirs(outdir) if any(i.glob("*.gcda"))]
+
+def removegcda(outdir):
+    "removes coverage data from the object directories"
+    for path in objectdirs(outdir):
+        for i in path.glob("*.gcda"):
+            i.unlink()
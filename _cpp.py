@@ -3,6 +3,7 @@
 u"Default cpp for waf"
 import sys
 import re
+import json
 import textwrap
 from   pathlib          import Path
 from typing             import Optional, List, Tuple, Dict
@@ -14,6 +15,7 @@ from waflib.Task        import Task
 from waflib.TaskGen     import after_method,feature
 from ._utils            import YES, runall, addmissing, Make, loading
 from ._requirements     import REQ as requirements
+from ._coverage         import saveobjectdirs as _saveobjectdirs
 from .git               import (
     lasthash       as _gitlasthash,
     isdirty        as _gitisdirty,
@@ -56,6 +58,13 @@ OPTIONS = {
             'links': '--coverage'
         },
     },
+    '+profile': {
+        i: {'cxx': '-O2 -g -fno-omit-frame-pointer'} for i in ('g++', 'clang++')
+    },
+    '+vecreport': {
+        'g++':     {'cxx': '-fopt-info-vec-missed'},
+        'clang++': {'cxx': '-Rpass-missed=loop-vectorize'},
+    },
     '+sanitize': {
         i: {
             'cxx':   '-fsanitize=address -fno-omit-frame-pointer -O0',
@@ -99,6 +108,8 @@ class Flags(Make):
                     - a '+' as first character will be replaced by '{cxxflags}.
                     - '+coverage' will be replaced by '{OPTIONS['+coverage']['g++']['cxx']}'.
                     - '+sanitize' will be replaced by '{OPTIONS['+sanitize']['g++']['cxx']}'.
+                    - '+profile' will be replaced by '{OPTIONS['+profile']['g++']['cxx']}'.
+                    - '+vecreport' will be replaced by '{OPTIONS['+vecreport']['g++']['cxx']}'.
             ''')
         )
 
@@ -112,11 +123,74 @@ class Flags(Make):
                         default = False,
                         action  = 'store_true',
                         help    = 'add coverage flags')
+        copt.add_option('--profiling',
+                        dest    = 'profileflags',
+                        default = False,
+                        action  = 'store_true',
+                        help    = 'add profiling flags: optimized, frame pointers & debug info')
+        copt.add_option('--vecreport',
+                        dest    = 'vecreportflags',
+                        default = False,
+                        action  = 'store_true',
+                        help    = 'add flags reporting loops which were not vectorized')
+        copt.add_option('--vecreport-output',
+                        dest    = 'VECREPORT_OUTPUT',
+                        default = None,
+                        action  = 'store',
+                        help    = 'vecreport command: path to the report (defaults to build/vecreport.txt)')
         copt.add_option('--sanitize',
                         dest    = 'sanitizeflags',
                         default = False,
                         action  = 'store_true',
                         help    = 'add sanitizing flags')
+        copt.add_option('--includes-json',
+                        dest    = 'INCLUDES_JSON',
+                        default = None,
+                        action  = 'store',
+                        help    = 'includes command: dump the include graph costs to a json file')
+        copt.add_option('--includes-top',
+                        dest    = 'INCLUDES_TOP',
+                        default = 20,
+                        type    = 'int',
+                        action  = 'store',
+                        help    = 'includes command: number of headers & units to display')
+        copt.add_option('--bench-baseline',
+                        dest    = 'CPPBENCH_BASELINE',
+                        default = None,
+                        action  = 'store',
+                        help    = 'bench command: compare with this git hash rather than the saved baseline')
+        copt.add_option('--bench-save',
+                        dest    = 'CPPBENCH_SAVE',
+                        default = False,
+                        action  = 'store_true',
+                        help    = 'bench command: save the results as the new baseline')
+        copt.add_option('--bench-threshold',
+                        dest    = 'CPPBENCH_THRESHOLD',
+                        default = .1,
+                        type    = 'float',
+                        action  = 'store',
+                        help    = 'bench command: fail on benchmarks slower than the baseline by this ratio')
+        copt.add_option('--bench-cpu',
+                        dest    = 'CPPBENCH_CPU',
+                        default = None,
+                        type    = 'int',
+                        action  = 'store',
+                        help    = 'bench command: cpu the benchmarks are pinned to (defaults to the last one)')
+        copt.add_option('--bench-args',
+                        dest    = 'CPPBENCH_ARGS',
+                        default = '',
+                        action  = 'store',
+                        help    = 'bench command: arguments for the benchmark programs, e.g. "--benchmark_repetitions=5"')
+        copt.add_option('--no-test-cache',
+                        dest    = 'CPPTEST_NOCACHE',
+                        default = False,
+                        action  = 'store_true',
+                        help    = 'cpptest command: rerun gtest programs which passed and did not change')
+        copt.add_option('--cpptest-args',
+                        dest    = 'CPPTEST_ARGS',
+                        default = '',
+                        action  = 'store',
+                        help    = 'cpptest command: arguments for the gtest programs, e.g. "--gtest_filter=Suite.*"')
 
     @staticmethod
     def convertFlags(cnf:Context, cxx, islinks = False):
@@ -410,6 +484,7 @@ def check_cpp_default(cnf:Context, name:str, version:Optional[str]):
                       atleast_version = version)
 
 _GTEST = re.compile(r'^\s*TEST\(')
+_BENCH = re.compile(r'^\s*BENCHMARK(_[A-Z_]+)?\(')
 _MAIN  = re.compile(r'^\s*int\s+main\s*\(\s*int[\s,].*')
 def splitmains(csrc, patt) -> Tuple[List[Path], List[Path]]:
     "detects whether a main function is declared"
@@ -419,29 +494,36 @@ def splitmains(csrc, patt) -> Tuple[List[Path], List[Path]]:
             itms[any(patt.match(line) for line in stream)].append(item)
     return itms
 
-@conf
-def build_cpp(bld:Context, name:str, version:str, ignore = None, **kwargs):
-    u"builds a cpp extension"
+def cppsources(bld:Context, path = None, ignore = None, exclude = ()) -> List:
+    u"returns the cpp sources in a path, discarding the build directory"
     rem  = [str(bld.bldnode)]
     rem += (
         [ignore]        if isinstance(ignore, str) else
         list(ignore)    if ignore                  else
         []
     )
-    csrc = [
+    return [
         i
-        for i in bld.path.ant_glob('**/*.cpp', excl = kwargs.get('exclude', []))
+        for i in (bld.path if path is None else path).ant_glob('**/*.cpp', excl = exclude)
         if not any(str(i).startswith(j) for j in rem)
     ]
+
+@conf
+def build_cpp(bld:Context, name:str, version:str, ignore = None, **kwargs):
+    u"builds a cpp extension"
+    csrc = cppsources(bld, ignore = ignore, exclude = kwargs.get('exclude', []))
     if len(csrc) == 0:
         return
 
     csrc, progs  = splitmains(csrc, _MAIN)
     csrc, gtests = splitmains(csrc, _GTEST)
+    csrc, benchs = splitmains(csrc, _BENCH)
 
+    testdata      = kwargs.pop("testdata", ())
     kwargs["use"] = [*kwargs.get("use", []), *build_stlib(bld, name, version, csrc, **kwargs)]
     build_prog(bld, name, version, progs, csrc, **kwargs)
-    build_gtests(bld, name, gtests, **kwargs)
+    build_gtests(bld, name, gtests, testdata, **kwargs)
+    build_benchmarks(bld, name, benchs, **kwargs)
 
 def build_stlib(bld, name, version, csrc, **args):
     "build a lib"
@@ -496,7 +578,23 @@ def build_prog(bld, name, version, progs, csrc, **args):
             **{i: j for i, j in specs[prog].items() if i != 'use'}
         ))
 
-def build_gtests(bld, name, sources, **kwa):
+TESTDATA = "cpptestdata.json"
+def loadtestdata(outdir) -> Dict[str, List[str]]:
+    "returns the data files declared per gtest program"
+    try:
+        with open(Path(outdir)/"c4che"/TESTDATA, 'r', encoding = 'utf-8') as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return {}
+
+def savetestdata(outdir, data: Dict[str, List[str]]):
+    "stores the data files declared per gtest program"
+    old = loadtestdata(outdir)
+    if any(old.get(i) != j for i, j in data.items()):
+        with open(Path(outdir)/"c4che"/TESTDATA, 'w', encoding = 'utf-8') as stream:
+            json.dump(dict(old, **data), stream)
+
+def build_gtests(bld, name, sources, testdata = (), **kwa):
     "build gtests"
     if sources:
         bld.program(**dict(
@@ -508,6 +606,37 @@ def build_gtests(bld, name, sources, **kwa):
             use    = kwa.get("use", [])+["gtest"]
         ))
 
+        # the cpptest command reruns the tests whenever this data changes
+        data = getattr(bld, 'cpptestdata', None)
+        if data is None:
+            data = bld.cpptestdata = {}
+            bld.add_post_fun(lambda x: savetestdata(x.out_dir, x.cpptestdata))
+        data[bld.path.get_bld().make_node(f"{name}_test_all").abspath()] = sorted(
+            i.abspath() for i in bld.path.ant_glob(list(testdata))
+        ) if testdata else []
+
+def build_benchmarks(bld, name, sources, **kwa):
+    "build google benchmarks"
+    if sources:
+        bld.program(**dict(
+            kwa,
+            source = sources,
+            target = f"{name}_bench_all",
+            name   = name + ': bench_all',
+            install_path = None,
+            use    = kwa.get("use", [])+["benchmark"],
+            lib    = kwa.get("lib", [])+["benchmark_main", "pthread"]
+        ))
+
+def builtprograms(bld:Context, mods, suffix:str) -> List[Path]:
+    "returns the programs built for the provided modules, e.g. with suffix '_test_all'"
+    names = {Path(i).name+suffix for i in mods}
+    return sorted(
+        Path(i.abspath())
+        for i in bld.bldnode.ant_glob(f'**/*{suffix} **/*{suffix}.exe')
+        if Path(i.abspath()).stem in names
+    )
+
 @conf
 def cpp_compiler_name(cnf:Context):
     u"Returns the compiler version used"
@@ -547,6 +676,48 @@ def apply_sysincpaths(self):
         for x in self.env.INCPATHS
     ]
 
+@feature('c','cxx')
+@after_method('process_source')
+def index_objectdirs(self):
+    "keep track of object directories: coverage data is looked for there only"
+    if '--coverage' not in self.env.LINKFLAGS:
+        return
+
+    dirs = getattr(self.bld, 'objectdirs', None)
+    if dirs is None:
+        dirs = self.bld.objectdirs = set()
+        self.bld.add_post_fun(lambda bld: _saveobjectdirs(bld.out_dir, bld.objectdirs))
+    dirs.update(
+        i.outputs[0].parent.abspath() for i in getattr(self, 'compiled_tasks', ())
+    )
+
+VECREPORT = {
+    '-fopt-info-vec-missed':        lambda x: [f'-fopt-info-vec-missed={x}.vec.txt'],
+    '-Rpass-missed=loop-vectorize': lambda x: [
+        '-Rpass-missed=loop-vectorize',
+        '-fsave-optimization-record',
+        f'-foptimization-record-file={x}.opt.yaml',
+        '-foptimization-record-passes=loop-vectorize'
+    ]
+}
+
+@feature('c','cxx')
+@after_method('process_source', 'propagate_uselib_vars')
+def apply_vecreport(self):
+    "have the vectorization report written next to each object"
+    # the task generator's and uselib flags must have been added already
+    for tsk in getattr(self, 'compiled_tasks', ()):
+        flags = tsk.env.CXXFLAGS
+        if not any(i in VECREPORT for i in flags):
+            continue
+        obj              = tsk.outputs[0].abspath()
+        tsk.env          = tsk.env.derive()
+        tsk.env.CXXFLAGS = [
+            j
+            for i in flags
+            for j in (VECREPORT[i](obj) if i in VECREPORT else [i])
+        ]
+
 def exec_command(self,cmd, __old__ = Task.exec_command, **kw):
     "execute cmd"
     if isinstance(cmd, list) and any('ISYSTEM' in i for i in cmd):
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+u"""
+Runs the google benchmark programs.
+
+*build_cpp* builds sources using the `BENCHMARK(` macros into a
+`<module>_bench_all` program. The `bench` command runs these programs one
+after the other, pinned to a single cpu, with json output. Times are stored
+per git hash and compared with a baseline, either saved explicitly or the
+results for another hash. Benchmarks slower than the baseline by more than a
+threshold fail the command.
+"""
+import os
+import json
+import subprocess
+from   pathlib          import Path
+from   typing           import Dict, Optional, Sequence
+from   waflib.Context   import Context
+from   waflib.Logs      import info
+from   ._cpp            import builtprograms
+from   .git             import lasthash
+
+BASELINE = 'cpp-baseline'
+UNITS    = {'ns': 1., 'us': 1e3, 'ms': 1e6, 's': 1e9}
+
+def parse(path) -> Dict[str, float]:
+    "returns the real time per benchmark in nanoseconds, using medians if repeated"
+    with open(path, 'r', encoding = 'utf-8') as stream:
+        itms = json.load(stream).get('benchmarks', [])
+
+    out: Dict[str, float] = {}
+    for itm in itms:
+        if itm.get('run_type') == 'aggregate' and itm.get('aggregate_name') != 'median':
+            continue
+        name = itm.get('run_name', itm['name'])
+        if itm.get('run_type') == 'aggregate' or name not in out:
+            out[name] = itm['real_time'] * UNITS.get(itm.get('time_unit', 'ns'), 1.)
+    return out
+
+def _pinned(cpu: Optional[int]):
+    if cpu is None or not hasattr(os, 'sched_setaffinity'):
+        return None
+    return lambda: os.sched_setaffinity(0, {cpu})
+
+def run(program: Path, output: Path, cpu: Optional[int], args: Sequence[str] = ()) -> Dict[str, float]:
+    "runs a benchmark program and returns its times"
+    subprocess.run(
+        [
+            str(program),
+            f'--benchmark_out={output}',
+            '--benchmark_out_format=json',
+            *args
+        ],
+        check      = True,
+        preexec_fn = _pinned(cpu) # pylint: disable=subprocess-popen-preexec-fn
+    )
+    return parse(output)
+
+def defaultcpu() -> Optional[int]:
+    "returns the last cpu available to the process"
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    return max(os.sched_getaffinity(0))
+
+def _load(path: Path) -> Optional[Dict[str, float]]:
+    try:
+        with open(path, 'r', encoding = 'utf-8') as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+
+def _save(path: Path, results: Dict[str, float]):
+    path.parent.mkdir(parents = True, exist_ok = True)
+    with open(path, 'w', encoding = 'utf-8') as stream:
+        json.dump(results, stream, indent = 1)
+
+def bench(bld: Context, mods: Sequence[str]):
+    "runs the benchmark programs and compares their times with the baseline"
+    opt   = bld.options
+    root  = Path(str(bld.bldnode))/"benchmarks"
+    progs = builtprograms(bld, mods, '_bench_all')
+    if not progs:
+        info("No benchmark program found: did you build?")
+        return
+
+    cpu   = getattr(opt, 'CPPBENCH_CPU', None)
+    cpu   = defaultcpu() if cpu is None or cpu < 0 else cpu
+    args  = (getattr(opt, 'CPPBENCH_ARGS', '') or '').split()
+    found: Dict[str, float] = {}
+    root.mkdir(parents = True, exist_ok = True)
+    for prog in progs:
+        info("Running %s on cpu %s", prog.name, cpu)
+        found.update({
+            f'{prog.stem}:{i}': j
+            for i, j in run(prog, root/f'{prog.stem}.json', cpu, args).items()
+        })
+
+    _save(root/f'cpp-{lasthash() or "nohash"}.json', found)
+    name = getattr(opt, 'CPPBENCH_BASELINE', None)
+    ref  = _load(root/f'{"cpp-"+name if name else BASELINE}.json') or {}
+
+    info("%12s%12s%9s  %s", "time (ns)", "baseline", "change", "benchmark")
+    for key, val in sorted(found.items()):
+        info(
+            "%12.1f%12s%9s  %s", val,
+            f"{ref[key]:.1f}"           if key in ref else '-',
+            f"{val/ref[key]-1.:+.1%}"   if key in ref else '-',
+            key
+        )
+
+    if getattr(opt, 'CPPBENCH_SAVE', False):
+        _save(root/f'{BASELINE}.json', found)
+        return
+
+    thr = getattr(opt, 'CPPBENCH_THRESHOLD', .1)
+    bad = [i for i, j in found.items() if i in ref and j > ref[i]*(1.+thr)]
+    if bad:
+        bld.fatal(f"{len(bad)} benchmarks regressed by more than {thr:.0%}: {', '.join(bad)}")
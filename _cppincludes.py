@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+u"""
+Static analysis of the c++ include graph.
+
+The sources are the ones *build_cpp* would compile. Includes are resolved
+using the module directory, the configured INCLUDES and the INCLUDES_* paths,
+SYS_INCS (BOOST, PYEXT, ...) included. Preprocessor conditions are ignored:
+the graph is an upper bound of what the compiler actually reads.
+
+For each header, the report provides:
+
+* *units*: the number of compilation units including it, directly or not,
+* *includers*: the number of files including it directly,
+* *lines*: its own line count,
+* *transitive*: its line count together with all it includes,
+* *cost*: summed over units, the number of lines which would no longer be
+read should the header be removed from the unit's direct includes.
+"""
+import re
+import json
+from   pathlib          import Path
+from   typing           import Dict, List, Set, Optional, Sequence, Iterable
+from   waflib.Context   import Context
+from   waflib.Logs      import info
+from   ._cpp            import cppsources
+
+_INCLUDE = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]')
+
+class IncludeGraph:
+    "The transitive include graph of compilation units"
+    def __init__(self, paths: Iterable, syspaths: Iterable = ()):
+        self.syspaths  = [Path(i).resolve() for i in syspaths]
+        self.paths     = [Path(i).resolve() for i in paths] + self.syspaths
+        self.units:     List[Path]             = []
+        self.lines:     Dict[Path, int]        = {}
+        self.edges:     Dict[Path, List[Path]] = {}
+        self.missing:   Set[str]               = set()
+        self._closures: Dict[Path, Set[Path]]  = {}
+
+    def add(self, *units):
+        "adds compilation units and parses everything they include"
+        stack = [Path(i).resolve() for i in units]
+        self.units.extend(i for i in stack if i not in self.units)
+        while stack:
+            path = stack.pop()
+            if path not in self.edges:
+                stack.extend(self.__parse(path))
+        self._closures.clear()
+        return self
+
+    def closure(self, path: Path, skip: Optional[Path] = None) -> Set[Path]:
+        "returns all files included by *path*, possibly discarding its direct include *skip*"
+        if skip is None and path in self._closures:
+            return self._closures[path]
+
+        found: Set[Path] = set()
+        stack            = [i for i in self.edges.get(path, ()) if i != skip]
+        while stack:
+            item = stack.pop()
+            if item in found or item == path:
+                continue
+            found.add(item)
+            stack.extend(self.edges.get(item, ()))
+
+        if skip is None:
+            self._closures[path] = found
+        return found
+
+    def transitive(self, path: Path) -> int:
+        "returns the number of lines read when including *path*"
+        return self.lines.get(path, 0) + sum(self.lines[i] for i in self.closure(path))
+
+    def costs(self, unit: Path) -> Dict[Path, int]:
+        "returns the lines each direct include adds to the unit"
+        full = self.closure(unit)
+        return {
+            head: sum(self.lines[i] for i in full - self.closure(unit, skip = head))
+            for head in self.edges.get(unit, ())
+        }
+
+    def report(self) -> dict:
+        "returns the costs per header and per unit"
+        heads: Dict[Path, dict] = {}
+        for children in self.edges.values():
+            for child in children:
+                heads.setdefault(child, self.__header(child))['includers'] += 1
+
+        units: Dict[str, dict] = {}
+        for unit in self.units:
+            for head in self.closure(unit):
+                heads[head]['units'] += 1
+
+            costs = self.costs(unit)
+            for head, cost in costs.items():
+                heads[head]['cost'] += cost
+
+            units[str(unit)] = dict(
+                lines      = self.lines[unit],
+                transitive = self.transitive(unit),
+                includes   = {
+                    str(i): j for i, j in sorted(costs.items(), key = lambda x: -x[1])
+                }
+            )
+
+        return dict(
+            headers = {
+                str(i): j for i, j in sorted(heads.items(), key = lambda x: -x[1]['cost'])
+            },
+            units   = dict(sorted(units.items(), key = lambda x: -x[1]['transitive'])),
+            missing = sorted(self.missing)
+        )
+
+    def __header(self, path: Path) -> dict:
+        return dict(
+            lines      = self.lines[path],
+            transitive = self.transitive(path),
+            system     = any(i in path.parents for i in self.syspaths),
+            units      = 0,
+            includers  = 0,
+            cost       = 0
+        )
+
+    def __parse(self, path: Path) -> List[Path]:
+        children: List[Path] = []
+        cnt                  = 0
+        with open(path, 'r', encoding = 'utf-8', errors = 'replace') as stream:
+            for cnt, line in enumerate(stream, 1):
+                if '#' not in line:
+                    continue
+                match = _INCLUDE.match(line)
+                if match is None:
+                    continue
+
+                child = self.__resolve(match.group(2), match.group(1) == '"', path)
+                if child is None:
+                    self.missing.add(match.group(2))
+                elif child not in children:
+                    children.append(child)
+
+        self.lines[path] = cnt
+        self.edges[path] = children
+        return children
+
+    def __resolve(self, name: str, quoted: bool, parent: Path) -> Optional[Path]:
+        for root in ([parent.parent] if quoted else []) + self.paths:
+            path = root/name
+            if path.is_file():
+                return path.resolve()
+        return None
+
+def includepaths(bld: Context, path) -> List[Path]:
+    "returns the include paths used by the tasks of a module"
+    root = Path(str(path))
+    out  = [root]
+    for i in bld.env.INCLUDES:
+        out.append((root/i).resolve())
+    return out
+
+def systemincludepaths(bld: Context) -> List[Path]:
+    "returns the include paths from all INCLUDES_* variables, SYS_INCS included"
+    out: List[Path] = []
+    for key in bld.env.keys():
+        if key.startswith('INCLUDES_'):
+            itms = getattr(bld.env, key)
+            out.extend(Path(i) for i in ([itms] if isinstance(itms, str) else itms))
+    return [j for i, j in enumerate(out) if j not in out[:i]]
+
+def includegraph(bld: Context, mods: Sequence[str]) -> IncludeGraph:
+    "returns the include graph for the provided modules"
+    graph = IncludeGraph((), systemincludepaths(bld))
+    for mod in mods:
+        path = bld.path.find_dir(mod)
+        if path is None:
+            continue
+
+        graph.paths = includepaths(bld, path) + graph.syspaths
+        graph.add(*(i.abspath() for i in cppsources(bld, path)))
+    return graph
+
+def includes(bld: Context, mods: Sequence[str]):
+    "prints the include costs for the c++ sources in the provided modules"
+    report = includegraph(bld, mods).report()
+    top    = getattr(bld.options, 'INCLUDES_TOP', 20)
+    root   = Path(str(bld.path))
+    name   = lambda x: (
+        str(Path(x).relative_to(root)) if root in Path(x).parents else Path(x).name
+    )
+
+    info("%-60s%8s%8s%8s%12s%12s", "header", "units", "incl.", "lines", "transitive", "cost")
+    for path, vals in list(report['headers'].items())[:top]:
+        info(
+            "%-60s%8d%8d%8d%12d%12d",
+            name(path), vals['units'], vals['includers'], vals['lines'],
+            vals['transitive'], vals['cost']
+        )
+
+    info("")
+    info("%-60s%8s%12s  %s", "unit", "lines", "transitive", "most expensive includes")
+    for path, vals in list(report['units'].items())[:top]:
+        itms = ', '.join(f'{name(i)}: {j}' for i, j in list(vals['includes'].items())[:3])
+        info("%-60s%8d%12d  %s", name(path), vals['lines'], vals['transitive'], itms)
+
+    if report['missing']:
+        info("\nunresolved includes: %d", len(report['missing']))
+
+    out = getattr(bld.options, 'INCLUDES_JSON', None)
+    if out:
+        with open(out, 'w', encoding = 'utf-8') as stream:
+            json.dump(report, stream, indent = 2)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+u"""
+Runs the gtest programs.
+
+*build_cpp* builds sources using the `TEST(` macros into a `<module>_test_all`
+program. The `cpptest` command runs all of these in parallel, each program
+being split into shards using gtest's own `GTEST_TOTAL_SHARDS` and
+`GTEST_SHARD_INDEX` variables. There are at most as many shards per program
+as jobs or tests.
+
+Each shard writes its own xml report. These are merged per program, then
+into a single junit report, next to the one created by the `test` command if
+any.
+
+Programs which passed are not rerun unless their key changed. The key hashes
+the program, the shared libraries it loads, the test data declared using
+`build_cpp(..., testdata = [patterns])` and the command-line arguments.
+"""
+import os
+import json
+import hashlib
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from   concurrent.futures   import ThreadPoolExecutor
+from   pathlib              import Path
+from   typing               import Dict, List, NamedTuple, Optional, Sequence
+from   waflib.Context       import Context
+from   waflib.Logs          import info, error
+from   ._cpp                import builtprograms, loadtestdata
+from   ._scheduler          import jobs as _jobs
+
+class Shard(NamedTuple):
+    "a shard of a gtest program"
+    program: Path
+    index:   int
+    total:   int
+    output:  Path
+
+class ShardResult(NamedTuple):
+    "the outcome of a shard"
+    shard:      Shard
+    returncode: int
+    stdout:     str
+
+def _md5(path) -> str:
+    out = hashlib.md5()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            out.update(chunk)
+    return out.hexdigest()
+
+def sharedlibs(program: Path) -> List[str]:
+    "returns the shared libraries loaded by a program"
+    try:
+        out = subprocess.run(
+            ['ldd', str(program)],
+            stdout   = subprocess.PIPE,
+            stderr   = subprocess.DEVNULL,
+            encoding = 'utf-8',
+            check    = False
+        ).stdout
+    except OSError:
+        return []
+    # lines are either "name => path (address)" or "path (address)"
+    itms = (i.split('=>')[-1].split('(')[0].strip() for i in out.split('\n'))
+    return sorted(i for i in itms if os.path.isabs(i))
+
+class ResultCache:
+    "keys of the gtest programs which passed"
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with open(self.path, 'r', encoding = 'utf-8') as stream:
+                self.passed: Dict[str, str] = json.load(stream)
+        except (OSError, ValueError):
+            self.passed = {}
+
+    @staticmethod
+    def key(program: Path, data: Sequence[str], args: Sequence[str]) -> str:
+        "returns the key for a program"
+        out = hashlib.md5(_md5(program).encode('utf-8'))
+        for lib in sharedlibs(program):
+            stat = os.stat(lib)
+            out.update(f'{lib}:{stat.st_size}:{stat.st_mtime_ns}'.encode('utf-8'))
+        for path in data:
+            out.update(f'{path}:{_md5(path) if os.path.exists(path) else None}'.encode('utf-8'))
+        out.update(repr(list(args)).encode('utf-8'))
+        return out.hexdigest()
+
+    def haspassed(self, program: Path, key: str) -> bool:
+        "whether the program passed with this key"
+        return self.passed.get(str(program)) == key
+
+    def update(self, program: Path, key: Optional[str]):
+        "stores the key of a program which passed, or forgets one which failed"
+        if key is None:
+            self.passed.pop(str(program), None)
+        else:
+            self.passed[str(program)] = key
+
+    def save(self):
+        "saves the keys"
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        with open(self.path, 'w', encoding = 'utf-8') as stream:
+            json.dump(self.passed, stream)
+
+def counttests(program: Path) -> int:
+    "returns the number of tests in a gtest program"
+    out = subprocess.run(
+        [str(program), '--gtest_list_tests'],
+        stdout   = subprocess.PIPE,
+        stderr   = subprocess.DEVNULL,
+        encoding = 'utf-8',
+        check    = False
+    ).stdout
+    # suites are flush left, tests are indented
+    return sum(1 for i in out.split('\n') if i.startswith(' ') and i.strip())
+
+def shards(programs: Sequence[Path], jobs: int, root: Path) -> List[Shard]:
+    "returns the shards, the largest programs first"
+    counts = {i: counttests(i) for i in programs}
+    return [
+        Shard(prog, ind, total, root/f'{prog.stem}-{ind}.xml')
+        for prog in sorted(programs, key = lambda x: -counts[x])
+        for total in (max(1, min(jobs, counts[prog])),)
+        for ind   in range(total)
+    ]
+
+def runshard(shard: Shard, args: Sequence[str] = ()) -> ShardResult:
+    "runs a single shard"
+    env = dict(
+        os.environ,
+        GTEST_TOTAL_SHARDS = str(shard.total),
+        GTEST_SHARD_INDEX  = str(shard.index),
+        GTEST_OUTPUT       = f'xml:{shard.output}'
+    )
+    if shard.output.exists():
+        shard.output.unlink()
+    proc = subprocess.run(
+        [str(shard.program), *args],
+        env      = env,
+        stdout   = subprocess.PIPE,
+        stderr   = subprocess.STDOUT,
+        encoding = 'utf-8',
+        errors   = 'replace',
+        check    = False
+    )
+    return ShardResult(shard, proc.returncode, proc.stdout)
+
+def mergexml(paths: Sequence[Path], output: Path, remove = True):
+    "merges gtest xml reports into a single junit report"
+    root  = ElementTree.Element('testsuites', name = 'cpptest')
+    total = dict.fromkeys(('tests', 'failures', 'disabled', 'errors'), 0)
+    time  = 0.
+    for path in paths:
+        if not path.exists():
+            continue
+        item = ElementTree.parse(path).getroot()
+        for key in total:
+            total[key] += int(item.get(key, 0))
+        time += float(item.get('time', 0.))
+        root.extend(list(item))
+        if remove:
+            path.unlink()
+
+    root.attrib.update({i: str(j) for i, j in total.items()}, time = f'{time:.3f}')
+    output.parent.mkdir(parents = True, exist_ok = True)
+    ElementTree.ElementTree(root).write(str(output), encoding = 'utf-8', xml_declaration = True)
+
+def junitpath(bld: Context) -> Path:
+    "returns the path to the junit report, next to pytest's if any"
+    out   = Path(str(bld.bldnode))
+    junit = getattr(bld.options, 'JUNIT_XML', None)
+    if junit:
+        junit = out/junit
+        return junit.with_name(junit.stem+'-cpp'+junit.suffix)
+    return out/'cpptest.xml'
+
+def cpptest(bld: Context, mods: Sequence[str]):
+    "runs the gtest programs in parallel shards"
+    progs = builtprograms(bld, mods, '_test_all')
+    if not progs:
+        info("No gtest program found: did you build?")
+        return
+
+    opt   = bld.options
+    root  = Path(str(bld.bldnode))/"cpptest"
+    root.mkdir(parents = True, exist_ok = True)
+    njobs = max(1, getattr(opt, 'jobs', 0) or _jobs())
+    args  = (getattr(opt, 'CPPTEST_ARGS', '') or '').split()
+    cache = ResultCache(Path(str(bld.bldnode))/"c4che"/"cpptestcache.json")
+    data  = loadtestdata(str(bld.bldnode))
+    keys  = {i: cache.key(i, data.get(str(i), ()), args) for i in progs}
+    if not getattr(opt, 'CPPTEST_NOCACHE', False):
+        cached = [
+            i for i in progs
+            if cache.haspassed(i, keys[i]) and (root/f'{i.stem}.xml').exists()
+        ]
+        for prog in cached:
+            info("%s: passed (cached)", prog.name)
+        progs = [i for i in progs if i not in cached]
+
+    todo  = shards(progs, njobs, root)
+    info("Running %d gtest programs in %d shards using %d jobs", len(progs), len(todo), njobs)
+
+    with ThreadPoolExecutor(njobs) as pool:
+        found = list(pool.map(lambda x: runshard(x, args), todo))
+
+    bad = [i for i in found if i.returncode]
+    for res in bad:
+        error(
+            "%s failed (shard %d/%d):\n%s",
+            res.shard.program.name, res.shard.index+1, res.shard.total, res.stdout
+        )
+
+    for prog in progs:
+        mergexml([i.output for i in todo if i.program == prog], root/f'{prog.stem}.xml')
+        failed = any(i.shard.program == prog for i in bad)
+        cache.update(prog, None if failed else keys[prog])
+    cache.save()
+
+    junit = junitpath(bld)
+    mergexml([root/f'{i.stem}.xml' for i in keys], junit, remove = False)
+    info("Junit report: %s", junit)
+    if bad:
+        bld.fatal(f"{len(bad)} gtest shards failed")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+u"""
+Report of the loops the compiler did not vectorize.
+
+With `--cxxflags=+vecreport` or `--vecreport`, each compilation writes the
+compiler's missed vectorizations next to its object: `*.vec.txt` for g++
+(`-fopt-info-vec-missed=...`) and `*.opt.yaml` for clang++ (optimization
+records for the loop-vectorize pass).
+
+The `vecreport` command gathers these per module and source line. Loops in
+headers are seen by every unit including them: entries are deduplicated.
+Paths are relative to the source directory and lines are sorted such that
+reports can be diffed between commits.
+"""
+import re
+from   pathlib          import Path
+from   typing           import Dict, Iterator, Optional, Sequence, Set, Tuple
+from   waflib.Context   import Context
+from   waflib.Logs      import info
+
+_GCC    = re.compile(r'^(?P<file>[^:\s][^:]*):(?P<line>\d+):(?P<col>\d+): missed: (?P<msg>.*)$')
+_LOC    = re.compile(r"DebugLoc:\s*\{\s*File:\s*'?(?P<file>[^',]+)'?,\s*Line:\s*(?P<line>\d+),\s*Column:\s*(?P<col>\d+)")
+_STRING = re.compile(r"-\s*String:\s*'(?P<val>(?:[^']|'')*)'")
+
+Entry = Tuple[str, int, int, str]
+
+def parsegcc(path: Path) -> Iterator[Entry]:
+    "yields the missed vectorizations from a g++ -fopt-info file"
+    with open(path, 'r', encoding = 'utf-8', errors = 'replace') as stream:
+        for line in stream:
+            match = _GCC.match(line.strip())
+            if match:
+                yield (
+                    match['file'], int(match['line']), int(match['col']), match['msg'].strip()
+                )
+
+def parseclang(path: Path) -> Iterator[Entry]:
+    "yields the missed vectorizations from a clang++ optimization record"
+    with open(path, 'r', encoding = 'utf-8', errors = 'replace') as stream:
+        docs = stream.read().split('--- !')
+    for doc in docs:
+        if not doc.startswith('Missed') or 'Pass:' not in doc:
+            continue
+        loc = _LOC.search(doc)
+        if loc is None:
+            continue
+        msg = ''.join(i['val'].replace("''", "'") for i in _STRING.finditer(doc))
+        yield loc['file'], int(loc['line']), int(loc['col']), ' '.join(msg.split())
+
+def _relative(name: str, cwd: Path, root: Path) -> Optional[str]:
+    path = (cwd/name).resolve()
+    return str(path.relative_to(root)) if root in path.parents else None
+
+def collect(bld: Context, mods: Sequence[str]) -> Dict[str, Set[Entry]]:
+    "returns the missed vectorizations per module"
+    root  = Path(str(bld.srcnode)).resolve()
+    cwd   = Path(str(bld.bldnode))
+    found: Dict[str, Set[Entry]] = {}
+    for mod in mods:
+        node = bld.bldnode.find_node(mod)
+        if node is None:
+            continue
+        itms = found.setdefault(Path(mod).name, set())
+        for path in node.ant_glob('**/*.vec.txt **/*.opt.yaml'):
+            parse = parsegcc if path.name.endswith('.vec.txt') else parseclang
+            for name, line, col, msg in parse(Path(path.abspath())):
+                rel = _relative(name, cwd, root)
+                if rel is not None:
+                    itms.add((rel, line, col, msg))
+    return found
+
+def report(found: Dict[str, Set[Entry]]) -> Iterator[str]:
+    "yields the report lines: one per module & source location"
+    for mod in sorted(found):
+        locs: Dict[Tuple[str, int, int], Set[str]] = {}
+        for name, line, col, msg in found[mod]:
+            locs.setdefault((name, line, col), set()).add(msg)
+        for (name, line, col), msgs in sorted(locs.items()):
+            yield f"{mod}\t{name}:{line}:{col}\t{'; '.join(sorted(msgs))}"
+
+def vecreport(bld: Context, mods: Sequence[str]):
+    "writes the report of loops which were not vectorized"
+    found  = collect(bld, mods)
+    output = Path(
+        getattr(bld.options, 'VECREPORT_OUTPUT', None)
+        or Path(str(bld.bldnode))/"vecreport.txt"
+    )
+    lines  = list(report(found))
+    with open(output, 'w', encoding = 'utf-8') as stream:
+        stream.write(''.join(i+'\n' for i in lines))
+
+    if not any(found.values()):
+        info("No vectorization report found: build with --cxxflags=+vecreport")
+        return
+    for mod in sorted(found):
+        cnt = sum(1 for i in lines if i.startswith(mod+'\t'))
+        info("%-30s%6d loops not vectorized", mod, cnt)
+    info("Report: %s", output)
@@ -65,16 +65,12 @@ def coffeelint(bld):
     if 'COFFEELINT' not in bld.env:
         return
 
-    if 'coffeelint' not in bld.group_names:
-        bld.add_group('coffeelint', move = False)
-
     for i in bld.path.ant_glob('**/*.coffee'):
         bld(
             source      = [i],
             rule        = lambda x, *_: coffeelintcompiler(bld, x, *_),
             color       = 'BLUE',
             cls_keyword = lambda _: 'CoffeeLint',
-            group       = 'coffeelint',
         )
 
 def build_coffeescript(bld:Context, name:str):
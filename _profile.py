@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+u"""
+The `profile` command: runs a program under a sampling profiler and writes
+folded stacks, ready for flamegraphs.
+
+    waf profile -- ./build/src/mymodule/myprogram args
+    waf profile -- python myscript.py args
+    waf profile --profile-app 0 -- args
+
+The third form runs one of the application's CMDLINES from the build
+directory, as would its launcher: `python -I cmdline scriptname`. These are
+recorded in *c4che/appcmdlines.json* when building the application.
+
+*perf* is used if available, using frame pointers: c++ code should be built
+with `--cxxflags=+profile` or `--profiling`. Otherwise, python programs are
+sampled by *_pysample.py*, which sees python frames only.
+
+Arguments containing a '=' are taken by waf as environment variables: quote
+these in a shell script.
+"""
+import re
+import sys
+import json
+import shlex
+import shutil
+import subprocess
+from   collections      import Counter
+from   itertools        import takewhile
+from   pathlib          import Path
+from   typing           import Iterable, List, Optional, Tuple
+from   waflib           import Options
+from   waflib.Context   import Context
+from   waflib.Logs      import info, warn
+from   ._utils          import Make
+
+_OFFSET = re.compile(r'\+0x[0-9a-fA-F]+$')
+
+def fold(lines: Iterable[str]) -> Counter:
+    "folds the output of `perf script`"
+    out: Counter = Counter()
+    stack: List[str] = []
+    comm  = None
+    for line in lines:
+        if not line.strip():
+            if comm is not None:
+                out[';'.join([comm, *stack[::-1]])] += 1
+            comm, stack = None, []
+        elif not line[0].isspace():
+            comm = line.split()[0]
+        elif comm is not None:
+            frame     = line.strip().split(' ', 1)[-1]
+            sym, _, dso = frame.rpartition(' (')
+            sym       = _OFFSET.sub('', sym)
+            if sym in ('', '[unknown]'):
+                sym = f'[{Path(dso.rstrip(")")).name}]'
+            stack.append(sym)
+    if comm is not None:
+        out[';'.join([comm, *stack[::-1]])] += 1
+    return out
+
+def hottest(stacks: Counter, count: int = 10) -> List[Tuple[str, int]]:
+    "returns the frames with the most samples at the top of the stack"
+    leaves: Counter = Counter()
+    for stack, cnt in stacks.items():
+        leaves[stack.rsplit(';', 1)[-1]] += cnt
+    return leaves.most_common(count)
+
+def _appcmdlinespath(bld: Context) -> Path:
+    return Path(str(bld.bldnode))/"c4che"/"appcmdlines.json"
+
+def saveappcmdlines(bld: Context, scriptname: str):
+    "records the application's command lines, as run by its launcher"
+    cmds = [['-I', *shlex.split(i), scriptname] for i, _ in bld.env.CMDLINES]
+    path = _appcmdlinespath(bld)
+    def _save(_):
+        with open(path, 'w', encoding = 'utf-8') as stream:
+            json.dump(cmds, stream)
+    bld.add_post_fun(_save)
+
+def commandline(bld: Context) -> Tuple[List[str], Optional[str]]:
+    "returns the program to profile and its working directory"
+    args = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+
+    # waf would otherwise try running these as commands
+    rest = [i for i in args if '=' not in i]
+    if rest and Options.commands[-len(rest):] == rest:
+        del Options.commands[-len(rest):]
+
+    app = getattr(bld.options, 'PROFILE_APP', None)
+    if app is not None:
+        try:
+            with open(_appcmdlinespath(bld), 'r', encoding = 'utf-8') as stream:
+                cmds = json.load(stream)
+        except (OSError, ValueError):
+            bld.fatal("No application command line found: did you build?")
+        if not 0 <= app < len(cmds):
+            bld.fatal(f"--profile-app must be in [0, {len(cmds)})")
+        return [sys.executable, *cmds[app], *args], str(bld.bldnode)
+    if args and args[0].endswith('.py'):
+        args = [sys.executable, *args]
+    return args, None
+
+def _ispython(cmd: List[str]) -> bool:
+    return Path(cmd[0]).name.startswith('python') or cmd[0] == sys.executable
+
+def _perf(cmd: List[str], cwd: Optional[str], data: Path, freq: int) -> Optional[Counter]:
+    perf = shutil.which('perf')
+    if perf is None:
+        return None
+    if data.exists():
+        data.unlink()
+    rec  = subprocess.run(
+        [perf, 'record', '-F', str(freq), '-g', '-o', str(data), '--', *cmd],
+        cwd   = cwd,
+        check = False
+    )
+    # perf returns the program's status: only missing data means perf failed
+    if not data.exists():
+        return None
+    if rec.returncode:
+        warn(f"The program exited with status {rec.returncode}")
+    out  = subprocess.run(
+        [perf, 'script', '-i', str(data)],
+        stdout   = subprocess.PIPE,
+        stderr   = subprocess.DEVNULL,
+        encoding = 'utf-8',
+        errors   = 'replace',
+        check    = False
+    )
+    return fold(out.stdout.split('\n'))
+
+def _python(cmd: List[str], cwd: Optional[str], output: Path, freq: int) -> Counter:
+    script = Path(__file__).parent/"_pysample.py"
+    # interpreter flags, such as the launcher's -I, go before the sampler
+    flags  = list(takewhile(lambda x: x.startswith('-') and x != '-m', cmd[1:]))
+    subprocess.run(
+        [cmd[0], *flags, str(script), str(output), str(1./freq), '--', *cmd[1+len(flags):]],
+        cwd   = cwd,
+        check = False
+    )
+    out: Counter = Counter()
+    if output.exists():
+        with open(output, 'r', encoding = 'utf-8') as stream:
+            for line in stream:
+                stack, _, cnt = line.rstrip().rpartition(' ')
+                out[stack] += int(cnt)
+    return out
+
+def profile(bld: Context):
+    "profiles a program, writing folded stacks"
+    opt      = bld.options
+    cmd, cwd = commandline(bld)
+    if not cmd:
+        bld.fatal("Nothing to profile: use waf profile -- cmd args or --profile-app")
+
+    output = Path(opt.PROFILE_OUTPUT or Path(str(bld.bldnode))/"profile.folded").resolve()
+    output.parent.mkdir(parents = True, exist_ok = True)
+    stacks = None
+    if not opt.PROFILE_PYTHON:
+        stacks = _perf(cmd, cwd, output.with_suffix('.perf.data'), opt.PROFILE_FREQUENCY)
+
+    if stacks is None:
+        if not _ispython(cmd):
+            bld.fatal("perf is not available and the program is not a python one")
+        info("Using the python sampler")
+        stacks = _python(cmd, cwd, output, opt.PROFILE_FREQUENCY)
+
+    with open(output, 'w', encoding = 'utf-8') as stream:
+        for stack, cnt in stacks.most_common():
+            print(stack, cnt, file = stream)
+
+    total = sum(stacks.values()) or 1
+    info("%d samples, folded stacks in %s", total, output)
+    for frame, cnt in hottest(stacks):
+        info("%6.1f%%  %s", 100.*cnt/total, frame)
+
+class Profiling(Make):
+    "options for the profile command"
+    @staticmethod
+    def options(opt):
+        "add options"
+        grp = opt.add_option_group('Profiling Options')
+        grp.add_option(
+            '--profile-app',
+            dest    = 'PROFILE_APP',
+            default = None,
+            type    = 'int',
+            action  = 'store',
+            help    = "profile command: run the application's CMDLINES at this index"
+        )
+        grp.add_option(
+            '--profile-output',
+            dest    = 'PROFILE_OUTPUT',
+            default = None,
+            action  = 'store',
+            help    = "profile command: path to the folded stacks (defaults to build/profile.folded)"
+        )
+        grp.add_option(
+            '--profile-frequency',
+            dest    = 'PROFILE_FREQUENCY',
+            default = 999,
+            type    = 'int',
+            action  = 'store',
+            help    = "profile command: samples per second"
+        )
+        grp.add_option(
+            '--profile-python',
+            dest    = 'PROFILE_PYTHON',
+            default = False,
+            action  = 'store_true',
+            help    = "profile command: use the python sampler even if perf is available"
+        )
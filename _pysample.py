@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A sampling profiler for python programs, used when *perf* is not available.
+
+A thread collects the python stacks of all other threads at regular
+intervals. Stacks are written as folded lines, `frame;frame;frame count`,
+ready for flamegraphs. Only python frames are seen: time spent in compiled
+extensions is attributed to the python function calling them.
+
+The module is a script:
+
+    python _pysample.py output.folded interval -- script.py args
+    python _pysample.py output.folded interval -- -m module args
+"""
+import os
+import sys
+import runpy
+import threading
+from   collections import Counter
+from   typing      import List
+
+# frames from the sampler itself are discarded
+_SKIP = {__file__, runpy.__file__, '<frozen runpy>'}
+
+def _frame(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class Sampler(threading.Thread):
+    "collects the stacks of other threads"
+    def __init__(self, interval: float):
+        super().__init__(daemon = True, name = 'wafbuilder-sampler')
+        self.interval = interval
+        self.done     = threading.Event()
+        self.stacks: Counter = Counter()
+
+    def run(self):
+        names = {}
+        while not self.done.wait(self.interval):
+            for ident, frame in sys._current_frames().items(): # pylint: disable=protected-access
+                if ident == self.ident:
+                    continue
+                if ident not in names:
+                    names.update({i.ident: i.name for i in threading.enumerate()})
+                stack: List[str] = []
+                while frame is not None:
+                    if frame.f_code.co_filename not in _SKIP:
+                        stack.append(_frame(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread'))
+                self.stacks[';'.join(stack[::-1])] += 1
+
+    def stop(self, output: str):
+        "stops sampling and writes the folded stacks"
+        self.done.set()
+        self.join()
+        with open(output, 'w', encoding = 'utf-8') as stream:
+            for stack, cnt in self.stacks.most_common():
+                print(stack, cnt, file = stream)
+
+def _main(output: str, interval: float, args: List[str]):
+    sampler = Sampler(interval)
+    sampler.start()
+    try:
+        if args[0] == '-m':
+            sys.argv = args[1:]
+            runpy.run_module(args[1], run_name = '__main__', alter_sys = True)
+        else:
+            sys.argv = args
+            sys.path.insert(0, os.path.dirname(os.path.abspath(args[0])))
+            runpy.run_path(args[0], run_name = '__main__')
+    finally:
+        sampler.stop(output)
+
+if __name__ == '__main__':
+    _main(sys.argv[1], float(sys.argv[2]), sys.argv[sys.argv.index('--')+1:])
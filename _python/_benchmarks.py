@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks: tests marked with `@pytest.mark.benchmark`.
+
+When running benchmarks, the pytest plugin *Benchmarker* calls each marked
+test a number of times for warming up, then repeatedly until both a minimum
+number of rounds and a minimum total time are reached. Fixtures are set up
+once. Statistics are computed over the timed rounds. The marker accepts
+`warmup`, `rounds` and `mintime` keywords.
+
+Results are stored per git hash. A run is compared with a baseline, either
+saved explicitly or the results for another hash: tests whose median is
+above the baseline's by more than a threshold are regressions.
+"""
+import os
+import json
+import time
+from   pathlib      import Path
+from   statistics   import mean, median, stdev
+from   typing       import Dict, List, Optional, Tuple
+
+import pytest # pylint: disable=import-error
+
+ENV       = 'WAFBUILDER_TEST_BENCHMARKS'
+WARMUP    = 3
+ROUNDS    = 10
+MINTIME   = .2
+MAXROUNDS = 10000
+BASELINE  = 'baseline'
+
+def stats(times: List[float]) -> Dict[str, float]:
+    "returns the statistics for a number of timed rounds"
+    ordered = sorted(times)
+    quart   = len(ordered)//4
+    return dict(
+        rounds = len(times),
+        min    = ordered[0],
+        max    = ordered[-1],
+        mean   = mean(times),
+        median = median(times),
+        stdev  = stdev(times) if len(times) > 1 else 0.,
+        iqr    = ordered[-1-quart]-ordered[quart]
+    )
+
+class Benchmarker:
+    "a pytest plugin timing tests marked as benchmarks"
+    def __init__(self, path: str):
+        self.path                              = path
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    @pytest.hookimpl(tryfirst = True)
+    def pytest_pyfunc_call(self, pyfuncitem):
+        "calls the test repeatedly"
+        mark = pyfuncitem.get_closest_marker('benchmark')
+        if mark is None:
+            return None
+
+        func  = pyfuncitem.obj
+        args  = {
+            i: pyfuncitem.funcargs[i]
+            for i in pyfuncitem._fixtureinfo.argnames # pylint: disable=protected-access
+        }
+        for _ in range(mark.kwargs.get('warmup', WARMUP)):
+            func(**args)
+
+        rounds  = mark.kwargs.get('rounds', ROUNDS)
+        mintime = mark.kwargs.get('mintime', MINTIME)
+        times: List[float] = []
+        while len(times) < MAXROUNDS and (len(times) < rounds or sum(times) < mintime):
+            start = time.perf_counter()
+            func(**args)
+            times.append(time.perf_counter()-start)
+
+        self.results[pyfuncitem.nodeid] = stats(times)
+        return True
+
+    def pytest_sessionfinish(self, session): # pylint: disable=unused-argument
+        "stores the results"
+        with open(self.path, 'w', encoding = 'utf-8') as stream:
+            json.dump(self.results, stream, indent = 1)
+
+class BenchmarkStore:
+    "benchmark results per git hash, and the baseline"
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self, name: str) -> Optional[Dict[str, Dict[str, float]]]:
+        "returns the results saved for a git hash or the baseline"
+        try:
+            with open(self.path/f'{name}.json', 'r', encoding = 'utf-8') as stream:
+                return json.load(stream)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, name: str, results: Dict[str, Dict[str, float]]):
+        "saves results for a git hash or as the baseline"
+        self.path.mkdir(parents = True, exist_ok = True)
+        with open(self.path/f'{name}.json', 'w', encoding = 'utf-8') as stream:
+            json.dump(results, stream, indent = 1)
+
+    @staticmethod
+    def regressions(
+            results:   Dict[str, Dict[str, float]],
+            baseline:  Dict[str, Dict[str, float]],
+            threshold: float
+    ) -> List[Tuple[str, float, float]]:
+        "returns the tests with a median above the baseline's by more than the threshold"
+        out = [
+            (i, j['median'], baseline[i]['median'])
+            for i, j in results.items()
+            if i in baseline and j['median'] > baseline[i]['median']*(1.+threshold)
+        ]
+        return sorted(out, key = lambda x: x[2]/x[1])
+
+def report(
+        results:  Dict[str, Dict[str, float]],
+        baseline: Optional[Dict[str, Dict[str, float]]] = None
+) -> List[str]:
+    "returns the report lines"
+    lines = [f"{'median':>10} {'iqr':>10} {'min':>10} {'rounds':>7} {'change':>8}  test"]
+    for node, itm in sorted(results.items()):
+        ref    = (baseline or {}).get(node)
+        change = f"{itm['median']/ref['median']-1.:+8.1%}" if ref else f"{'-':>8}"
+        lines.append(
+            f"{itm['median']*1e6:8.1f}us {itm['iqr']*1e6:8.1f}us {itm['min']*1e6:8.1f}us"
+            f" {itm['rounds']:7d} {change}  {node}"
+        )
+    return lines
+
+def pytest_configure(config):
+    "registers the marker & the plugin when loaded using `-p`"
+    config.addinivalue_line(
+        "markers",
+        "benchmark(warmup, rounds, mintime): a micro-benchmark, timed when running benchmarks"
+    )
+    path = os.environ.get(ENV)
+    if path and not config.pluginmanager.has_plugin('wafbuilder-benchmarks'):
+        config.pluginmanager.register(Benchmarker(path), 'wafbuilder-benchmarks')
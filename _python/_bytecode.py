@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bytecode compilation in bulk.
+
+Waf's *py* feature creates one *pyc* or *pyo* task, thus one python process,
+per file. Those tasks are replaced by a few per task generator, each of which
+compiles up to *CHUNK* files in a single process. Editing a file recompiles
+only its chunk, and waf's scheduler runs chunks in parallel. Outputs are the
+same, such that installing is left unchanged.
+"""
+import os
+import json
+import tempfile
+from   waflib           import Task
+from   waflib.TaskGen   import feature, after_method
+from   .._utils         import Make
+
+class ByteCode(Make):
+    "bytecode compilation options"
+    @staticmethod
+    def options(opt):
+        "add options"
+        opt.get_option_group('Python Options')\
+           .add_option('--pyc-checked-hash',
+                       dest    = 'PYC_CHECKED_HASH',
+                       default = False,
+                       action  = 'store_true',
+                       help    = (
+                           "create deterministic bytecode, checked against the"
+                           " sources' hash rather than their timestamp"
+                       ))
+
+    @staticmethod
+    def build(bld):
+        "sets the invalidation mode"
+        bld.env.PYC_INVALIDATION = (
+            'checked-hash' if getattr(bld.options, 'PYC_CHECKED_HASH', False) else
+            'timestamp'
+        )
+
+CHUNK = 32
+
+class pybytecode(Task.Task): # pylint: disable=invalid-name
+    "compiles a chunk of the python files of a task generator at once"
+    color = 'PINK'
+    vars  = ['PYTHON', 'PYFLAGS_OPT', 'PYC_INVALIDATION']
+    items: list = []
+
+    def __str__(self):
+        return f'{len(self.inputs)} python files'
+
+    def keyword(self):
+        return 'Bytecode'
+
+    def run(self):
+        bld  = self.generator.bld
+        req  = dict(
+            invalidation = self.env.PYC_INVALIDATION or 'timestamp',
+            items        = [(i.abspath(), j.abspath(), k, opt) for i, j, k, opt in self.items]
+        )
+
+        fid, path = tempfile.mkstemp(dir = bld.bldnode.abspath(), suffix = '.json')
+        try:
+            with os.fdopen(fid, 'w', encoding = 'utf-8') as stream:
+                json.dump(req, stream)
+            script = os.path.join(os.path.dirname(__file__), '_pycompile.py')
+            return self.exec_command([*self.env.PYTHON, script, path])
+        finally:
+            os.remove(path)
+
+@feature('py')
+@after_method('process_source')
+def apply_pybytecode(self):
+    "replaces the one-per-file bytecode tasks by a few, compiling chunks of files"
+    old = [i for i in self.tasks if type(i).__name__ in ('pyc', 'pyo')]
+    if not old:
+        return
+
+    level = 2 if '-OO' in self.env.PYFLAGS_OPT else 1
+    self.tasks = [i for i in self.tasks if i not in old]
+    # sorted such that chunks change only when files are added or removed
+    old.sort(key = lambda i: (i.inputs[0].abspath(), i.outputs[0].abspath()))
+    for ind in range(0, len(old), CHUNK):
+        chunk     = old[ind:ind+CHUNK]
+        tsk       = self.create_task(
+            'pybytecode', [i.inputs[0] for i in chunk], [i.outputs[0] for i in chunk]
+        )
+        tsk.items = [
+            (i.inputs[0], i.outputs[0], i.pyd, 0 if type(i).__name__ == 'pyc' else level)
+            for i in chunk
+        ]
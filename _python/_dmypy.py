@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Type checking using the mypy daemon.
+
+A single daemon is used per build directory. It outlives the build such that
+only modules which changed are rechecked by the next one. A single task checks
+all files in one go, once all have been copied: errors which an edit causes in
+modules importing it are reported even though these did not change.
+"""
+import os
+import re
+import subprocess
+from   typing   import Dict, List, Optional, Tuple
+
+_LINE = re.compile(r'^(?P<path>.+?):\d+(:\d+)?: (?P<kind>error|warning|note): ')
+
+class DMypyServer:
+    "runs the mypy daemon"
+    STATUS = '.dmypy.json'
+    def __init__(self):
+        self.cmd: List[str]     = []
+        self.cwd: Optional[str] = None
+
+    def setup(self, dmypy: Optional[List[str]], cwd: str):
+        "sets the daemon executable and the build directory"
+        self.cmd = list(dmypy or [])
+        self.cwd = cwd
+        return self
+
+    def __bool__(self):
+        return len(self.cmd) > 0
+
+    def check(self, paths: List[str], args: List[str]) -> Tuple[int, str]:
+        "returns the status and mypy's output for files relative to the build directory"
+        files = sorted({os.path.normpath(i) for i in paths})
+        # 'run' restarts the daemon should the flags have changed
+        out   = subprocess.run(
+            [*self.cmd, '--status-file', self.STATUS, 'run', '--', *args, *files],
+            cwd      = self.cwd,
+            stdout   = subprocess.PIPE,
+            stderr   = subprocess.STDOUT,
+            encoding = 'utf-8',
+            check    = False
+        )
+
+        lines: Dict[str, List[str]] = {}
+        errs                        = 0
+        for line in out.stdout.split('\n'):
+            match = _LINE.match(line)
+            if match is None:
+                continue
+            lines.setdefault(os.path.normpath(match.group('path')), []).append(line)
+            errs |= match.group('kind') == 'error'
+
+        if out.returncode and not errs:
+            # the daemon itself failed
+            return out.returncode, out.stdout
+        return int(errs), '\n'.join(i for j in sorted(lines) for i in lines[j])
+
+SERVER = DMypyServer()
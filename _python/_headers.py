@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Python header & encoding checks for a whole module at a time.
+
+Each file is read once: its two first lines are compared to the expected
+headers and its remaining lines are scanned for FIXME, TODO and DEBUG markers.
+Results are stored per file together with waf's signature for the file such
+that unchanged files are neither read nor parsed again in the next builds.
+These results are kept in the build directory rather than in the lint cache:
+waf's signatures are reused rather than hashing each file again.
+"""
+import io
+import re
+import json
+import threading
+from   pathlib  import Path
+from   typing   import Dict, Iterable, List, Optional, Tuple
+
+HEADERS = '#!/usr/bin/env python3\n', '# -*- coding: utf-8 -*-\n'
+_FIXME  = re.compile(r".*#\s*(FIXME|TODO|DEBUG).*")
+
+def checkheaders(path: str, content: bytes) -> Tuple[str, str]:
+    "returns the header violations and the FIXME/TODO/DEBUG markers in a file"
+    try:
+        # universal newlines, as when reading the file in text mode
+        lines = io.StringIO(content.decode('utf-8'), newline = None).readlines()
+    except UnicodeDecodeError as exc:
+        return f'In file {path}:\n\t- Not utf-8: {exc}', ''
+
+    tpl  = 'Missing or incorrect header line %d: '
+    errs = [
+        tpl % i + head for i, head in enumerate(HEADERS)
+        if len(lines) <= i or lines[i] != head
+    ]
+    msg  = f'In file {path}:\n\t- ' + '\t- '.join(errs) if errs else ''
+
+    todo = ''
+    for i, line in enumerate(lines):
+        if '#' not in line:
+            continue
+        match = _FIXME.match(line)
+        if match:
+            todo += f'\n{path}|{i} col 1 warning| [{match.group(1)}]\n`'
+    return msg, todo
+
+class HeaderChecker:
+    "checks headers, skipping files with unchanged content"
+    def __init__(self):
+        self.path: Optional[Path]                     = None
+        self.results: Dict[str, Tuple[str, str, str]] = {}
+        self.lock                                     = threading.Lock()
+
+    def setup(self, path: Path) -> bool:
+        "loads previous results: returns whether this was needed"
+        if self.path == path:
+            return False
+        self.path    = path
+        self.results = {}
+        try:
+            with open(path, 'r', encoding = 'utf-8') as stream:
+                self.results = {i: tuple(j) for i, j in json.load(stream).items()}
+        except (OSError, ValueError, TypeError):
+            pass
+        return True
+
+    def save(self):
+        "saves the results for the next build"
+        if self.path is None:
+            return
+        with self.lock:
+            with open(self.path, 'w', encoding = 'utf-8') as stream:
+                json.dump(self.results, stream)
+
+    def check(self, files: Iterable[Tuple[str, str]]) -> Tuple[List[str], List[str]]:
+        "returns all header violations and markers in the files, given with their signature"
+        errs: List[str] = []
+        todo: List[str] = []
+        for path, sig in files:
+            with self.lock:
+                found = self.results.get(path)
+            if found is None or found[0] != sig:
+                with open(path, 'rb') as stream:
+                    content = stream.read()
+                found = (sig, *checkheaders(path, content))
+                with self.lock:
+                    self.results[path] = found
+
+            if found[1]:
+                errs.append(found[1])
+            if found[2]:
+                todo.append(found[2])
+        return errs, todo
+
+CHECKER = HeaderChecker()
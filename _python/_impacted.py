@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Selects the test files impacted by changes since a git revision.
+
+Changed python files are mapped to their modules. Other changed files in a
+module's directory, c++ sources in particular, impact the whole module through
+its python extension. Modules importing those, transitively, are impacted as
+well. A test file is selected if it changed or imports an impacted module.
+Any change to a *conftest.py* selects all tests.
+
+C++ dependencies between modules, through waf's *use*, are not followed: a
+change to a library only impacts the modules which import it in python.
+"""
+from   pathlib          import Path
+from   typing           import Iterator, List, Optional, Sequence, Set
+from   ..git            import changes
+from   ._imports        import GRAPH as IMPORTS, rootmodulename
+
+def sourceroots(bld) -> List[Path]:
+    "returns the directories containing the modules"
+    base = Path(str(getattr(bld, 'srcnode', bld.path))).resolve()
+    return [(base/i).resolve() for i in bld.env.MODULE_SOURCE_DIR] or [base]
+
+def moduledirs(bld) -> Iterator[Path]:
+    "yields the module directories, skipping hidden ones and the build directory"
+    out = Path(str(getattr(bld, 'out_dir', 'build'))).resolve()
+    for root in sourceroots(bld):
+        for mod in root.iterdir():
+            if mod.is_dir() and not mod.name.startswith('.') and mod != out:
+                yield mod
+
+def impactedmodules(bld, changed: Sequence[Path]) -> Set[str]:
+    "returns the modules impacted by changed files"
+    for mod in moduledirs(bld):
+        # parses only files which changed since the last call
+        IMPORTS.imports(mod.glob('**/*.py'), mod.name)
+
+    roots          = sourceroots(bld)
+    mods: Set[str] = set()
+    for path in changed:
+        root = next((i for i in roots if i in path.parents), None)
+        if root is None:
+            continue
+        if path.suffix == '.py':
+            mods.add(rootmodulename(path, roots) or path.relative_to(root).parts[0])
+        else:
+            mods.add(path.relative_to(root).parts[0])
+
+    for mod in list(mods):
+        mods.update(IMPORTS.importers(mod))
+    return mods
+
+def impacted(bld, tests: Sequence[Path], since: str = 'HEAD') -> Optional[List[Path]]:
+    "returns the test files impacted by changes since a revision, None if unknown"
+    changed = changes(since)
+    if changed is None:
+        return None
+
+    IMPORTS.setup(Path(getattr(bld, 'out_dir', 'build'))/"c4che"/"pyimports.json")
+    tests = [Path(i).resolve() for i in tests]
+    if any(i.name == 'conftest.py' for i in changed):
+        return tests
+
+    paths = set(changed)
+    mods  = impactedmodules(bld, changed)
+    found = [i for i in tests if i in paths or mods & IMPORTS.imports([i])]
+    IMPORTS.save()
+    return found
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The import graph of python modules.
+
+Imports are found using `ast`, such that multi-line and relative imports are
+understood. Results are stored per file, together with its modification time
+and size, and only files which changed are parsed again in the next builds.
+
+Imported names are stored as absolute dotted names together with all their
+parents: `from a.b import c` yields *a*, *a.b* and *a.b.c*.
+"""
+import ast
+import json
+import threading
+from   collections  import deque
+from   pathlib      import Path
+from   typing       import Dict, Iterable, List, Optional, Set, Tuple
+
+def modulename(path: Path, name: Optional[str] = None) -> Optional[str]:
+    "returns the dotted module name for a file in a directory named *name*"
+    if name is None:
+        return None
+    parts = [path.stem] if path.stem != '__init__' else []
+    for parent in path.parents:
+        if parent.name == name:
+            return '.'.join([name, *reversed(parts)])
+        parts.append(parent.name)
+    return None
+
+def rootmodulename(path: Path, roots: Iterable[Path]) -> Optional[str]:
+    "returns the dotted module name for a file in one of the source directories"
+    for root in roots:
+        if root in path.parents:
+            return modulename(path, path.relative_to(root).parts[0])
+    return None
+
+def _parents(name: str) -> List[str]:
+    parts = name.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts)+1)]
+
+def parseimports(content: str, package: Optional[str] = None) -> List[str]:
+    "returns the absolute names imported by python code in a given package"
+    found: Set[str] = set()
+    for node in ast.walk(ast.parse(content)):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                found.update(_parents(alias.name))
+            continue
+
+        if not isinstance(node, ast.ImportFrom):
+            continue
+
+        if node.level:
+            if not package:
+                continue
+            base = package.split('.')
+            base = base[:len(base)-node.level+1]
+            if not base:
+                continue
+            root = '.'.join(base + ([node.module] if node.module else []))
+        elif node.module:
+            root = node.module
+        else:
+            continue
+
+        found.update(_parents(root))
+        # imported names can be modules
+        found.update(root+'.'+i.name for i in node.names if i.name != '*')
+    return sorted(found)
+
+class ImportGraph:
+    "imports per file, updated incrementally"
+    def __init__(self):
+        self.path: Optional[Path]                              = None
+        self.files: Dict[str, Tuple[List[int], Optional[str], List[str]]] = {}
+        self.lock                                              = threading.Lock()
+
+    def setup(self, path: Path) -> bool:
+        "loads previous results: returns whether this was needed"
+        if self.path == path:
+            return False
+        self.path  = path
+        self.files = {}
+        try:
+            with open(path, 'r', encoding = 'utf-8') as stream:
+                self.files = {i: tuple(j) for i, j in json.load(stream).items()}
+        except (OSError, ValueError, TypeError):
+            pass
+        return True
+
+    def save(self):
+        "saves the results for the next build"
+        if self.path is None:
+            return
+        with self.lock:
+            with open(self.path, 'w', encoding = 'utf-8') as stream:
+                json.dump(self.files, stream)
+
+    def update(self, path, name: Optional[str] = None) -> List[str]:
+        "parses a file, should it have changed, and returns its imports"
+        path = Path(str(getattr(path, 'abspath', lambda: path)()))
+        key  = str(path)
+        try:
+            stat = path.stat()
+        except OSError:
+            return []
+
+        sig  = [stat.st_mtime_ns, stat.st_size]
+        with self.lock:
+            found = self.files.get(key)
+        if found is not None and list(found[0]) == sig and (name is None or found[1]):
+            return list(found[2])
+
+        module  = modulename(path, name)
+        package = (
+            name   if module is None else
+            module if path.stem == '__init__' else
+            module.rpartition('.')[0]
+        )
+        try:
+            imps = parseimports(path.read_text(encoding = 'utf-8'), package)
+        except (SyntaxError, ValueError, UnicodeDecodeError):
+            imps = []
+
+        with self.lock:
+            self.files[key] = (sig, module, imps)
+        return imps
+
+    def module(self, path, name: Optional[str] = None) -> Optional[str]:
+        "returns the module name for a file, parsing it should it have changed"
+        self.update(path, name)
+        with self.lock:
+            found = self.files.get(str(getattr(path, 'abspath', lambda: path)()))
+        return None if found is None else found[1]
+
+    def imports(self, files: Iterable, name: Optional[str] = None) -> Set[str]:
+        "returns the names imported by the files, parsing those which changed"
+        out: Set[str] = set()
+        for path in files:
+            out.update(self.update(path, name))
+        return out
+
+    def modules(self) -> Dict[str, str]:
+        "returns the file per known module"
+        with self.lock:
+            return {j[1]: i for i, j in self.files.items() if j[1]}
+
+    def dependencies(self, module: str, transitive = True) -> Set[str]:
+        "returns the known modules imported by *module*"
+        mods  = self.modules()
+        graph = self.__graph(mods)
+        return self.__walk(graph, module, transitive)
+
+    def closure(self, path, name: Optional[str] = None) -> Set[str]:
+        "returns the files of the known modules imported by a file, directly or not"
+        mods            = self.modules()
+        found: Set[str] = set()
+        queue           = deque(self.update(path, name))
+        while queue:
+            item = queue.popleft()
+            if item in mods and mods[item] not in found:
+                found.add(mods[item])
+                queue.extend(self.update(mods[item], item.split('.')[0]))
+        found.discard(str(Path(str(getattr(path, 'abspath', lambda: path)()))))
+        return found
+
+    def importers(self, module: str, transitive = True) -> Set[str]:
+        "returns the known modules importing *module*"
+        graph: Dict[str, Set[str]] = {}
+        for mod, imps in self.__graph(self.modules()).items():
+            for imp in imps:
+                graph.setdefault(imp, set()).add(mod)
+        return self.__walk(graph, module, transitive)
+
+    def __graph(self, mods: Dict[str, str]) -> Dict[str, Set[str]]:
+        with self.lock:
+            return {
+                i: {k for k in self.files[j][2] if k in mods and k != i}
+                for i, j in mods.items()
+            }
+
+    @staticmethod
+    def __walk(graph: Dict[str, Set[str]], module: str, transitive: bool) -> Set[str]:
+        found: Set[str] = set()
+        queue           = deque(graph.get(module, ()))
+        while queue:
+            item = queue.popleft()
+            if item in found or item == module:
+                continue
+            found.add(item)
+            if transitive:
+                queue.extend(graph.get(item, ()))
+        return found
+
+GRAPH = ImportGraph()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lint results cached by content.
+
+The key for a file is the hash of:
+
+* the linter name and version,
+* the linter's arguments and the content of its configuration file,
+* the file's content,
+* the content of other files it depends upon: imported modules for mypy,
+python extensions, ...
+
+The cache lives outside the build directory such that it survives *waf clean*,
+branch switches and can be shared between CI checkouts. Both the status and the
+output are stored, failures being replayed as they were first reported. Linters
+which could not run at all return a *Failure*: these results are not stored.
+
+Entries are touched whenever used. Those unused for *MAXAGE* seconds are
+removed, the cache being pruned at most once per *PRUNE* seconds.
+"""
+import os
+import time
+import json
+import hashlib
+import tempfile
+import threading
+import subprocess
+from   pathlib  import Path
+from   typing   import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+DEFAULT = Path(os.environ.get('XDG_CACHE_HOME', Path.home()/'.cache'))/'wafbuilder'/'lint'
+
+class Failure(NamedTuple):
+    "the status & output of a linter which could not run: never cached"
+    status: int
+    output: str
+
+class LintCache:
+    "lint results stored per content hash"
+    MAXAGE = 30*86400
+    PRUNE  = 86400
+    def __init__(self):
+        self.root: Optional[Path]     = None
+        self.versions: Dict[str, str] = {}
+        self.lock                     = threading.Lock()
+
+    def setup(self, root: Optional[str]):
+        "sets the cache directory: None disables the cache"
+        self.root = None if not root else Path(root)
+        return self
+
+    def __bool__(self):
+        return self.root is not None
+
+    def version(self, linter: str, cmd: Optional[List[str]]) -> str:
+        "returns the linter version, calling it only once"
+        with self.lock:
+            if linter not in self.versions:
+                if not cmd:
+                    self.versions[linter] = ''
+                else:
+                    out = subprocess.run(
+                        [*cmd, '--version'],
+                        stdout   = subprocess.PIPE,
+                        stderr   = subprocess.STDOUT,
+                        encoding = 'utf-8',
+                        check    = False
+                    )
+                    self.versions[linter] = out.stdout.strip()
+            return self.versions[linter]
+
+    @staticmethod
+    def key(*items: str, files: Iterable = ()) -> str:
+        "returns the hash of strings and file contents"
+        sha = hashlib.sha256()
+        for item in items:
+            sha.update(item.encode('utf-8'))
+            sha.update(b'\0')
+        for path in files:
+            try:
+                with open(path, 'rb') as stream:
+                    sha.update(stream.read())
+            except OSError:
+                sha.update(str(path).encode('utf-8'))
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[int, str]]:
+        "returns the cached status & output, if any"
+        if self.root is None:
+            return None
+        path = self.__path(key)
+        try:
+            with open(path, 'r', encoding = 'utf-8') as stream:
+                val = json.load(stream)
+            out = int(val[0]), str(val[1])
+        except (OSError, ValueError, IndexError):
+            return None
+        try:
+            # entries in use are not pruned
+            os.utime(path)
+        except OSError:
+            pass
+        return out
+
+    def set(self, key: str, status: int, out: str):
+        "stores the status & output"
+        if self.root is None:
+            return
+        path = self.__path(key)
+        path.parent.mkdir(parents = True, exist_ok = True)
+        # write & rename: concurrent builds never see half-written files
+        fid, tmp = tempfile.mkstemp(dir = str(path.parent), suffix = '.tmp')
+        with os.fdopen(fid, 'w', encoding = 'utf-8') as stream:
+            json.dump([status, out], stream)
+        os.replace(tmp, path)
+
+    def prune(self) -> int:
+        "removes entries unused for too long, returning their number"
+        if self.root is None:
+            return 0
+        stamp = self.root/'.pruned'
+        now   = time.time()
+        try:
+            if now - stamp.stat().st_mtime < self.PRUNE:
+                return 0
+        except OSError:
+            pass
+        if not self.root.exists():
+            return 0
+        stamp.touch()
+
+        cnt = 0
+        for path in self.root.glob('*/*.json'):
+            try:
+                if now - path.stat().st_mtime > self.MAXAGE:
+                    path.unlink()
+                    cnt += 1
+            except OSError:
+                pass
+        return cnt
+
+    def __path(self, key: str) -> Path:
+        return self.root/key[:2]/(key+'.json')
+
+CACHE = LintCache()
@@ -2,15 +2,23 @@
 # -*- coding: utf-8 -*-
 "All *basic* python related details"
 import sys
-import re
+import shutil
+import subprocess
+from functools        import lru_cache
 from pathlib          import Path
-from typing           import Sequence, List  # pylint: disable=unused-import
+from typing           import Sequence, List, Optional, Set, Tuple  # pylint: disable=unused-import
+from waflib           import Logs
 from waflib.Context   import Context
 from .._requirements  import REQ as requirements
 from .._utils         import copytargets
-from ._pybind11       import pymoduledependencies
+from ..git            import changes
+from ._pylintserver   import SERVER as PYLINT_SERVER
+from ._dmypy          import SERVER as DMYPY_SERVER
+from ._lintcache      import CACHE as LINT_CACHE, DEFAULT as LINT_CACHE_DEFAULT, Failure
+from ._headers        import CHECKER as HEADERS
+from ._imports        import GRAPH as IMPORTS, rootmodulename
+from ._impacted       import moduledirs, sourceroots
 
-_open = lambda x: open(x, 'r', encoding = 'utf-8')
 requirements.addcheck(requirements.programversion, lang = 'python', name = 'pylint')
 
 @requirements.addcheck
@@ -28,6 +36,7 @@ def check_python_mypy(cnf, name, version):
 
     cmd = getattr(cnf.env, name.upper()) + ["-c", '"print(1)"']
     cnf.cmd_and_log(cmd)
+    cnf.find_program("dmypy", var = "DMYPY", mandatory = False)
 
 class Linting:
     "all rules for checking python"
@@ -38,13 +47,30 @@ class Linting:
         if bld.options.DO_PY_LINTING is False or len(items) == 0 or bld.cmd != 'build':
             return
 
+        LINT_CACHE.setup(getattr(bld.options, 'LINT_CACHE', None)).prune()
+        if IMPORTS.setup(Path(bld.out_dir)/"c4che"/"pyimports.json"):
+            bld.add_post_fun(lambda _: IMPORTS.save())
         deps  = cls.__make_deps(bld, name, items)
-        rules = cls.__make_rules(bld, deps, discards)
+        rules = cls.__make_rules(bld, name, items, deps, discards)
 
+        since   = getattr(bld.options, 'LINT_SINCE', None)
+        checked = cls.__changed(bld, name, items, since) if since else list(items)
         if name in deps:
-            items = [i for _, i in copytargets(bld, name, items)]
+            items   = [i for _, i in copytargets(bld, name, items)]
+            checked = [i for _, i in copytargets(bld, name, checked)]
 
-        for item in items:
+        if DMYPY_SERVER:
+            # the daemon checks all files at once
+            mypy  = [i for i in rules if i['cls_keyword'](None) == 'MyPy']
+            rules = [i for i in rules if i not in mypy]
+            for kwargs in mypy:
+                cls.__dmypytask(bld, kwargs, checked)
+
+        # headers are checked for the whole module at once
+        headers = cls.__encodingrule(bld)
+        bld(source = list(items), name = name+':python headers', **headers)
+
+        for item in checked:
             for kwargs in rules:
                 bld(source = [item],
                     name   = str(item)+':'+kwargs['cls_keyword'](None).lower(),
@@ -53,83 +79,222 @@ class Linting:
     @staticmethod
     def options(opt: Context):
         "add options"
-        return (
-            opt
-            .add_option_group("Python Options")
-            .add_option(
-                "--nolinting",
-                help    = "Discard linting jobs",
-                default = True,
-                dest    = "DO_PY_LINTING",
-                action  = "store_false",
-            )
+        grp = opt.add_option_group("Python Options")
+        grp.add_option(
+            "--nolinting",
+            help    = "Discard linting jobs",
+            default = True,
+            dest    = "DO_PY_LINTING",
+            action  = "store_false",
+        )
+        grp.add_option(
+            "--pylint-workers",
+            help    = (
+                "Number of long-lived pylint processes linting files in batches."
+                " Defaults to a quarter of the jobs. Use 0 for one process per file."
+            ),
+            default = None,
+            type    = "int",
+            dest    = "PYLINT_WORKERS",
+            action  = "store",
+        )
+        grp.add_option(
+            "--dmypy",
+            help    = (
+                "Type check using a mypy daemon, kept alive between builds,"
+                " rather than one mypy process per file"
+            ),
+            default = False,
+            dest    = "DMYPY",
+            action  = "store_true",
+        )
+        grp.add_option(
+            "--lint-cache",
+            help    = (
+                "Directory where lint results are cached by content, surviving"
+                f" clean builds (defaults to {LINT_CACHE_DEFAULT}). Use '' to disable."
+            ),
+            default = str(LINT_CACHE_DEFAULT),
+            dest    = "LINT_CACHE",
+            action  = "store",
         )
+        grp.add_option(
+            "--lint-since",
+            help    = (
+                "Run pylint & mypy only on files changed since the merge base"
+                " with this git revision, as well as on the modules importing them"
+            ),
+            default = None,
+            dest    = "LINT_SINCE",
+            action  = "store",
+        )
+        return grp
 
     @staticmethod
-    def __pylintrule():
+    def pylintargs() -> List[str]:
+        "returns the pylint arguments"
         crlf   = '' if sys.platform == 'linux' else ',unexpected-line-ending-format'
-        pylint = ('${PYLINT} ${SRC} '
-                  + '--msg-template="{path}:{line}:{column}:{C}: [{symbol}] {msg}" '
-                  + '--disable=locally-disabled,fixme%s ' % crlf
-                  + '--reports=no '
-                  + '--score=n'
-                  )
+        args   = [
+            '--msg-template={path}:{line}:{column}:{C}: [{symbol}] {msg}',
+            '--disable=locally-disabled,fixme%s' % crlf,
+            '--reports=no',
+            '--score=n'
+        ]
 
         for name in ('', 'linting', '..', '../linting'):
             path = Path(name)/'pylintrc'
             if path.exists():
-                pylint += ' --rcfile="'+str(path.resolve())+'"'
+                args.append('--rcfile='+str(path.resolve()))
                 break
+        return args
+
+    @classmethod
+    def __pylintrule(cls, bld, name):
+        args    = cls.pylintargs()
+        workers = getattr(bld.options, 'PYLINT_WORKERS', None)
+        if workers is None:
+            workers = max(1, bld.jobs//4)
+
+        # workers must import the pylint which was configured
+        if PYLINT_SERVER.setup(_pylintpython(tuple(bld.env.PYLINT)), workers, str(bld.bldnode)):
+            run = lambda path: PYLINT_SERVER.lint(path, args)
+        else:
+            # pylint's status 32 is a usage error
+            run = lambda path: cls.__exec(bld, [*bld.env.PYLINT, path, *args], 32)
 
         return dict(color       = 'YELLOW',
-                    rule        = pylint,
+                    rule        = cls.__cachedrule(bld, 'pylint', args, run, imports = name),
+                    vars        = ['PYLINT'],
                     cls_keyword = lambda _: 'PyLint')
 
     @staticmethod
-    def __mypyrule():
-        mypy   = ('${MYPY} ${SRC}  --ignore-missing-imports '
-                  +'--follow-imports=skip')
+    def mypyargs(daemon = False) -> List[str]:
+        "returns the mypy arguments"
+        # the daemon is given all files at once: imports can be followed
+        args = ['--ignore-missing-imports', '--follow-imports='+('normal' if daemon else 'skip')]
         for name in ('', 'linting', '..', '../linting'):
             path = Path(name)/'mypy.ini'
             if path.exists():
-                mypy += ' --config-file="'+str(path.resolve())+'"'
+                args.append('--config-file='+str(path.resolve()))
                 break
+        return args
+
+    @classmethod
+    def __mypyrule(cls, bld, name):
+        dmypy = bld.env.DMYPY if getattr(bld.options, 'DMYPY', False) else None
+        if DMYPY_SERVER.setup(dmypy, str(bld.bldnode)):
+            args = cls.mypyargs(True)
+            def _rule(tsk):
+                status, out = DMYPY_SERVER.check(
+                    [i.path_from(bld.bldnode) for i in tsk.inputs], args
+                )
+                if out:
+                    Logs.info(out, extra = {'stream': sys.stdout, 'c1': ''})
+                return status
+
+            return dict(color       = 'BLUE',
+                        rule        = _rule,
+                        vars        = ['MYPY', 'DMYPY'],
+                        cls_keyword = lambda _: 'MyPy')
+
+        args = cls.mypyargs()
+        # mypy's status 2 is a crash or a usage error
+        run  = lambda path: cls.__exec(bld, [*bld.env.MYPY, path, *args], 2)
         return dict(color       = 'BLUE',
-                    rule        = mypy,
+                    rule        = cls.__cachedrule(bld, 'mypy', args, run),
+                    vars        = ['MYPY'],
                     cls_keyword = lambda _: 'MyPy')
 
+    @staticmethod
+    def __dmypytask(bld, kwargs, items):
+        "a single task for all modules: it runs once all files are copied"
+        if not items:
+            return
+        name = 'python:mypy'
+        tgen = next((i for i in bld.get_all_task_gen() if getattr(i, 'name', None) == name), None)
+        if tgen is None:
+            tgen = bld(source = [], name = name, **dict(kwargs, waitfor = []))
+        tgen.source.extend(items)
+        tgen.waitfor.extend(kwargs['waitfor'])
+
     @staticmethod
     def __encodingrule(bld):
-        fixme = re.compile(r".*#\s*(FIXME|TODO|DEBUG).*")
+        if HEADERS.setup(Path(bld.out_dir)/"c4che"/"pyheaders.json"):
+            bld.add_post_fun(lambda _: HEADERS.save())
+
         def _checkencoding(tsk):
-            headers = '#!/usr/bin/env python3\n', '# -*- coding: utf-8 -*-\n'
-            abspath = tsk.inputs[0].abspath()
-
-            with _open(abspath) as stream:
-                errs    = [True]*2
-                try:
-                    for i, head in enumerate(headers):
-                        errs[i] = next(stream) != head
-                except IOError as ex:
-                    bld.fatal("Could not open file", ex)
-                except StopIteration:
-                    pass
-
-            tpl = 'Missing or incorrect header line %d: '
-            msg = '\t- '.join((tpl % i + headers[i])  for i in range(len(errs)) if errs[i])
-            if len(msg):
-                bld.fatal(f'In file {abspath}:\n\t- {msg}')
-
-            with _open(tsk.inputs[0].abspath()) as stream:
-                for i, line in enumerate(stream):
-                    match = fixme.match(line)
-                    if match:
-                        bld.to_log(f'\n{abspath}|{i} col 1 warning| [{match.group(1)}]\n`')
+            # waf has already computed the inputs' signatures
+            errs, todo = HEADERS.check([(i.abspath(), i.get_bld_sig().hex()) for i in tsk.inputs])
+            if todo:
+                bld.to_log(''.join(todo))
+            if errs:
+                bld.fatal('\n'.join(errs))
 
         return dict(color       = 'CYAN',
                     rule        = _checkencoding,
                     cls_keyword = lambda _: 'python headers')
 
+    @staticmethod
+    def __exec(bld, cmd, failed: int) -> Tuple[int, str]:
+        "runs a linter: a *failed* status means it could not run"
+        out = subprocess.run(
+            cmd,
+            cwd      = str(bld.bldnode),
+            stdout   = subprocess.PIPE,
+            stderr   = subprocess.STDOUT,
+            encoding = 'utf-8',
+            check    = False
+        )
+        if out.returncode < 0 or (out.returncode & failed) == failed:
+            return Failure(out.returncode, out.stdout)
+        return out.returncode, out.stdout
+
+    @staticmethod
+    def __changed(bld, name, items, since) -> list:
+        "returns items changed since a revision or importing changed modules"
+        found = _changessince(bld, since)
+        if found is None:
+            return list(items)
+
+        paths, mods = found
+        return [
+            i for i in items
+            if Path(i.abspath()).resolve() in paths or IMPORTS.module(i, name) in mods
+        ]
+
+    @staticmethod
+    def __cachedrule(bld, linter, args, run, imports = None):
+        """
+        returns a rule which calls *run* on a path relative to the build directory
+        unless results are found in the lint cache. With *imports* set to the
+        module name, the project files imported by the one checked, directly or
+        not, are also hashed.
+        """
+        config = [i[i.find('=')+1:] for i in args if i.startswith(('--rcfile', '--config-file'))]
+        def _rule(tsk):
+            path  = tsk.inputs[0].path_from(bld.bldnode)
+            key   = found = None
+            if LINT_CACHE:
+                files = [__file__, tsk.inputs[0].abspath(), *config]
+                files.extend(i.abspath() for i in tsk.dep_nodes)
+                if imports:
+                    files.extend(sorted(IMPORTS.closure(tsk.inputs[0], imports)))
+
+                cmd   = getattr(bld.env, linter.upper(), None)
+                key   = LINT_CACHE.key(
+                    linter, LINT_CACHE.version(linter, cmd), *args, files = files
+                )
+                found = LINT_CACHE.get(key)
+
+            res         = run(path) if found is None else found
+            status, out = res
+            if key is not None and found is None and not isinstance(res, Failure):
+                LINT_CACHE.set(key, status, out)
+            if out:
+                Logs.info(out, extra = {'stream': sys.stdout, 'c1': ''})
+            return status
+        return _rule
+
     @classmethod
     def __make_deps(cls, bld:Context, name:str, items:Sequence) -> List:
         if cls.INCLUDE_PYEXTS:
@@ -137,31 +302,81 @@ class Linting:
             if any(i.get_name() == name+':pyext' for i in bld.get_all_task_gen()):
                 pyext.add(name)
 
-            return list(pymoduledependencies(items, name) & pyext)
+            return list(IMPORTS.imports(items, name) & pyext)
         return []
 
     @classmethod
-    def __make_rules(cls, bld, deps, discards) -> list:
-        def _scan(_):
-            nodes = [bld.get_tgen_by_name(dep+':pyext').tasks[-1].outputs[0] for dep in deps]
-            return (nodes, [])
+    def __make_rules(cls, bld, name, items, deps, discards) -> list:
+        # linters read the modules imported from the build directory: they must
+        # have been copied there first
+        mods = {name} | {i.split('.')[0] for i in IMPORTS.imports(items, name)}
+        bdir = Path(str(bld.bldnode))
+        pyis = {dep+':pyi' for dep in deps}
 
-        rules = [cls.__encodingrule(bld)] # type: List
+        def _waitfor(tgen) -> bool:
+            tname = str(getattr(tgen, 'name', ''))
+            if tname in pyis:
+                return True
+            if tname.endswith(':copying'):
+                path = Path(str(tgen.target[0]))
+                return bdir in path.parents and path.relative_to(bdir).parts[0] in mods
+            return False
+
+        # lint tasks depend only on the stubs of the pyext they import: c++
+        # changes which leave the python API untouched do not trigger them
+        waits = dict(
+            features     = 'waitfor',
+            waitfor      = _waitfor,
+            waitfor_deps = lambda x: str(getattr(x, 'name', '')) in pyis
+        )
+
+        rules = [] # type: List
         if ('python', 'mypy') in requirements and 'mypy' not in discards:
-            rules.append(cls.__mypyrule())
-            rules[-1]['scan']  = _scan
-            rules[-1]['group'] = 'mypy'
-            if 'mypy' not in bld.group_names:
-                bld.add_group('mypy', move = False)
+            rules.append(dict(cls.__mypyrule(bld, name), **waits))
 
         if ('python', 'pylint') in requirements and 'pylint' not in discards:
-            rules.append(cls.__pylintrule())
-            rules[-1]['scan']  = _scan
-            rules[-1]['group'] = 'pylint'
-            if 'pylint' not in bld.group_names:
-                bld.add_group('pylint', move = False)
+            rules.append(dict(cls.__pylintrule(bld, name), **waits))
         return rules
 
+@lru_cache(maxsize = 1)
+def _pylintpython(cmd: Tuple[str, ...]) -> Optional[str]:
+    "returns the interpreter running the pylint command, if it can be found"
+    if cmd[1:3] == ('-m', 'pylint'):
+        return cmd[0]
+    try:
+        with open(cmd[0], 'rb') as stream:
+            line = stream.readline(256)
+    except (OSError, IndexError):
+        return None
+
+    # windows launchers are binaries and pyenv shims are shell scripts: linting
+    # then falls back on one process per file
+    args = line[2:].decode('utf-8', 'replace').split() if line.startswith(b'#!') else []
+    if args and Path(args[0]).name == 'env':
+        args = [i for i in args[1:] if not i.startswith('-') and '=' not in i]
+    if not args or not Path(args[0]).name.startswith(('python', 'pypy')):
+        return None
+    return shutil.which(args[0])
+
+@lru_cache(maxsize = 1)
+def _changessince(bld:Context, since:str) -> Optional[Tuple[Set[Path], Set[str]]]:
+    "returns the files changed since a revision and the modules impacted, once per build"
+    changed = changes(since)
+    if changed is None:
+        Logs.warn(f"Could not find changes since {since}: linting everything")
+        return None
+
+    for mod in moduledirs(bld):
+        # importers are found only in files already parsed
+        IMPORTS.imports(mod.glob('**/*.py'), mod.name)
+
+    roots = sourceroots(bld)
+    mods  = {rootmodulename(i, roots) for i in changed if i.suffix == '.py'}
+    mods.discard(None)
+    for mod in list(mods):
+        mods.update(IMPORTS.importers(mod))
+    return set(changed), mods
+
 def checkpy(bld:Context, name:str, items:Sequence, *discards):
     "builds tasks for checking code"
     return Linting.run(bld, name, items, *discards)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Files copied to the build directory, per module.
+
+The manifest of the previous build is kept in *c4che*. Files which are no
+longer copied are found as a set difference rather than by walking the build
+directory and checking each file against its source.
+"""
+import json
+from   pathlib  import Path
+from   typing   import Callable, Dict, Iterable, List, Optional, Set
+
+class Manifest:
+    "files copied per module"
+    def __init__(self):
+        self.path: Optional[Path]       = None
+        self.files: Dict[str, Set[str]] = {}
+
+    def setup(self, path: Path) -> bool:
+        "loads the previous manifest: returns whether this was needed"
+        if self.path == path:
+            return False
+        self.path  = path
+        self.files = {}
+        try:
+            with open(path, 'r', encoding = 'utf-8') as stream:
+                self.files = {i: set(j) for i, j in json.load(stream).items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+        return True
+
+    def save(self):
+        "saves the manifest for the next build"
+        if self.path is None:
+            return
+        with open(self.path, 'w', encoding = 'utf-8') as stream:
+            json.dump({i: sorted(j) for i, j in self.files.items()}, stream)
+
+    def stale(
+            self,
+            name:     str,
+            files:    Iterable[str],
+            previous: Callable[[], Iterable[str]]
+    ) -> List[str]:
+        """
+        updates the module's files and returns those no longer copied.
+        The *previous* callable is used when no manifest exists yet.
+        """
+        current = set(files)
+        old     = self.files.get(name)
+        if old is None:
+            old = set(previous())
+        self.files[name] = current
+        return sorted(old - current)
+
+MANIFEST = Manifest()
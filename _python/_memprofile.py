@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-test memory profiling.
+
+For each test, the pytest plugin *MemProfiler* records:
+
+* the tracemalloc peak, i.e. python allocations only,
+* the largest allocation sites, as found by a thread taking a snapshot
+  whenever the python memory reaches a new high,
+* the increase of the process' RSS high-water mark. This accounts for
+  allocations in python extensions, which tracemalloc cannot see. On linux,
+  the high-water mark is reset before each test. Elsewhere only tests which
+  reach a new process-wide peak show an increase.
+
+Tests can set a budget using the marker `@pytest.mark.memory(peak, rss)`,
+both in megabytes: exceeding it fails the test.
+
+Like the durations recorder, the plugin is configured using an environment
+variable such that parallel workers inherit it. Each process writes its own
+json file and these are merged once the run is over.
+"""
+import os
+import sys
+import json
+import glob
+import threading
+import tracemalloc
+from   typing       import Any, Dict, List, Optional, Tuple
+
+import pytest # pylint: disable=import-error
+
+ENV    = 'WAFBUILDER_TEST_MEMPROFILE'
+FRAMES = 10
+TOP    = 5
+MB     = 1024**2
+PERIOD = .01
+
+def _resetpeakrss() -> bool:
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding = 'utf-8') as stream:
+            stream.write('5')
+        return True
+    except OSError:
+        return False
+
+def peakrss() -> int:
+    "returns the process' RSS high-water mark in bytes"
+    try:
+        with open('/proc/self/status', 'r', encoding = 'utf-8') as stream:
+            for line in stream:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])*1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak*1024
+
+def budget(item) -> Tuple[Optional[float], Optional[float]]:
+    "returns the test's peak & rss budgets in megabytes"
+    mark = item.get_closest_marker('memory')
+    if mark is None:
+        return None, None
+    peak = mark.args[0] if mark.args else mark.kwargs.get('peak', None)
+    return peak, mark.kwargs.get('rss', None)
+
+class _Sampler(threading.Thread):
+    "takes a snapshot whenever the traced memory reaches a new high"
+    def __init__(self):
+        super().__init__(daemon = True)
+        self.done     = threading.Event()
+        self.snapshot = None
+        self.size     = MB
+
+    def run(self):
+        while not self.done.wait(PERIOD):
+            size = tracemalloc.get_traced_memory()[0]
+            if size > self.size*1.1:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.size     = size
+
+    def stop(self) -> Optional[tracemalloc.Snapshot]:
+        "stops sampling and returns the largest snapshot"
+        self.done.set()
+        self.join()
+        return self.snapshot
+
+class MemProfiler:
+    "a pytest plugin recording memory peaks per test"
+    def __init__(self, path: str):
+        self.path                        = path
+        self.results: List[Dict[str, Any]] = []
+        self.started                     = False
+
+    def pytest_configure(self, config): # pylint: disable=unused-argument
+        "starts tracing"
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(FRAMES)
+            self.started = True
+
+    @pytest.hookimpl(wrapper = True)
+    def pytest_runtest_call(self, item):
+        "measures the test"
+        tracemalloc.clear_traces()
+        _resetpeakrss()
+        start   = peakrss()
+        sampler = _Sampler()
+        sampler.start()
+        try:
+            res = yield
+        except BaseException:
+            self.__record(item, start, sampler)
+            raise
+
+        info = self.__record(item, start, sampler)
+        errs = [
+            f"{i} {info[i]/MB:.1f}MB > {j}MB"
+            for i, j in info['budget'].items()
+            if j is not None and info[i] > j*MB
+        ]
+        if errs:
+            info['failed'] = True
+            pytest.fail("memory budget exceeded: " + ", ".join(errs), pytrace = False)
+        return res
+
+    def pytest_sessionfinish(self, session): # pylint: disable=unused-argument
+        "stores the results"
+        if self.results:
+            with open(f'{self.path}.{os.getpid()}', 'w', encoding = 'utf-8') as stream:
+                json.dump(self.results, stream)
+
+    def pytest_unconfigure(self, config): # pylint: disable=unused-argument
+        "stops tracing"
+        if self.started:
+            tracemalloc.stop()
+
+    def __record(self, item, start: int, sampler: _Sampler) -> Dict[str, Any]:
+        peak  = tracemalloc.get_traced_memory()[1]
+        rss   = peakrss()
+        snap  = sampler.stop() or tracemalloc.take_snapshot()
+        snap  = snap.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, threading.__file__),
+        ))
+        info = dict(
+            nodeid  = item.nodeid,
+            peak    = peak,
+            rss     = max(0, rss - start),
+            maxrss  = rss,
+            sites   = [
+                dict(site = str(i.traceback[0]), size = i.size, count = i.count)
+                for i in snap.statistics('lineno')[:TOP]
+            ],
+            budget  = dict(zip(('peak', 'rss'), budget(item))),
+            failed  = False
+        )
+        self.results.append(info)
+        return info
+
+def merge(path: str) -> List[Dict[str, Any]]:
+    "merges the files written by each process, returning the tests ranked by peak"
+    out: List[Dict[str, Any]] = []
+    for name in glob.glob(glob.escape(path)+'.*'):
+        try:
+            with open(name, 'r', encoding = 'utf-8') as stream:
+                out.extend(json.load(stream))
+        except (OSError, ValueError):
+            pass
+        os.remove(name)
+
+    out.sort(key = lambda x: -max(x['peak'], x['rss']))
+    with open(path, 'w', encoding = 'utf-8') as stream:
+        json.dump(out, stream, indent = 1)
+    return out
+
+def report(results: List[Dict[str, Any]], top: int = 20) -> List[str]:
+    "returns the report lines for the most expensive tests"
+    lines = [f"{'peak':>10} {'rss':>10}  test"]
+    for info in results[:top]:
+        flag = ' !' if info['failed'] else ''
+        lines.append(f"{info['peak']/MB:8.1f}MB {info['rss']/MB:8.1f}MB  {info['nodeid']}{flag}")
+        for site in info['sites'][:3]:
+            lines.append(f"{'':22}{site['size']/MB:8.2f}MB in {site['count']} blocks at {site['site']}")
+    return lines
+
+def pytest_configure(config):
+    "registers the marker & the profiler when loaded using `-p`"
+    config.addinivalue_line(
+        "markers",
+        "memory(peak, rss): memory budgets in megabytes, checked when profiling"
+    )
+    path = os.environ.get(ENV)
+    if path and not config.pluginmanager.has_plugin('wafbuilder-memprofile'):
+        # pytest_configure being historic, the plugin's own is called as well
+        config.pluginmanager.register(MemProfiler(path), 'wafbuilder-memprofile')
@@ -10,9 +10,31 @@ from .._utils               import Make, copyargs, copyroot
 from .._cpp                 import Flags as CppFlags
 from .._requirements        import REQ as requirements
 from ._base                 import hascompiler, check_python, store
+from ._imports              import GRAPH as IMPORTS
 
 _open = lambda x: open(x, 'r', encoding = 'utf-8')
 
+# flags per ISA variant & compiler. The module template checks the same
+# features at import time, which it can only do with g++ or clang++ on x86.
+ISAS  = {
+    'avx512': dict.fromkeys(
+        ('g++', 'clang++'),
+        '-mavx512f -mavx512cd -mavx512bw -mavx512dq -mavx512vl -mavx2 -mfma'
+    ),
+    'avx2':   dict.fromkeys(('g++', 'clang++'), '-mavx2 -mfma'),
+}
+
+_ISACHECK = """
+#if !defined(__x86_64__) && !defined(__i386__)
+#   error "ISA variants are for x86 targets only"
+#endif
+int main()
+{
+    __builtin_cpu_init();
+    return __builtin_cpu_supports("avx2") ? 0 : 1;
+}
+"""
+
 class PyBind11(Make):
     "tests pybind11 and obtains its headers"
     _NAME = 'python', 'pybind11'
@@ -27,6 +49,16 @@ class PyBind11(Make):
                        default = None,
                        action  = 'store',
                        help    = 'pybind11 include path')
+        opt.get_option_group('Python Options')\
+           .add_option('--pyext-isa',
+                       dest    = 'PYEXT_ISA',
+                       default = '',
+                       action  = 'store',
+                       help    = (
+                           'build python extensions for these ISAs as well, picking'
+                           ' the best one at import time: '+','.join(ISAS)
+                           + '. Set WAFBUILDER_ISA to force one, e.g. "baseline"'
+                       ))
 
     _DONE = False
     @classmethod
@@ -40,6 +72,20 @@ class PyBind11(Make):
             store(cnf, '-I'+cnf.options.pybind11)
 
         cnf.env.append_unique('CXXFLAGS_PYEXT', CppFlags.defaultcxx(cnf).split(" "))
+
+        isas = [i.strip() for i in getattr(cnf.options, 'PYEXT_ISA', '').split(',') if i.strip()]
+        if any(i not in ISAS for i in isas):
+            cnf.fatal(f'Unknown ISA in {isas}: choose among {list(ISAS)}')
+        for isa in isas:
+            if cnf.env.COMPILER_CXX not in ISAS[isa]:
+                cnf.fatal(f'--pyext-isa requires g++ or clang++, not {cnf.env.COMPILER_CXX}')
+            cnf.check_cxx(fragment  = _ISACHECK,
+                          cxxflags  = ISAS[isa][cnf.env.COMPILER_CXX].split(),
+                          execute   = False,
+                          msg       = f'checking for {isa} variants on an x86 target',
+                          mandatory = True)
+        # best first: the module picks the first one the cpu supports
+        cnf.env.PYEXT_ISA = [i for i in ISAS if i in isas]
         def _build(bld):
             lib_node = bld.srcnode.make_node('pybind11example.cpp')
             lib_node.write("""
@@ -62,28 +108,8 @@ class PyBind11(Make):
                       mandatory = True)
 
 def pymoduledependencies(pysrc, name = None):
-    "detects dependencies"
-    patterns = tuple(re.compile(r'^\s*'+pat) for pat in
-                     (r'from\s+([\w.]+)\s+import\s+', r'import\s*(\w+)'))
-    mods = set()
-    path = lambda x: _open(getattr(x, 'abspath', lambda: x)())
-    for item in pysrc:
-        with closing(path(item)) as stream:
-            for line in stream: # pylint: disable=not-an-iterable
-                if 'import' not in line:
-                    continue
-
-                for pat in patterns:
-                    ans = pat.match(line)
-                    if ans is None:
-                        continue
-
-                    grp = ans.group(1)
-                    if grp.startswith('._core') and name is not None:
-                        mods.add(name)
-                    else:
-                        mods.add(grp)
-    return mods
+    "detects dependencies: names imported by the python sources"
+    return IMPORTS.imports(pysrc, name)
 
 def findpyext(bld:Context, items:Sequence):
     "returns a list of pyextension in that module"
@@ -107,6 +133,19 @@ def haspyext(csrc):
                 return True
     return False
 
+def _pyextmodule(bld, name, version, mod, isa, variants):
+    "the source declaring the python module"
+    return bld(features = 'subst',
+               source   = bld.srcnode.find_resource(__package__.replace('.', '/')
+                                                    +'/_module.template'),
+               target   = name+"module"+('' if isa == 'baseline' else '_'+isa)+".cpp",
+               name     = str(bld.path)+":pybind11"+('' if isa == 'baseline' else ':'+isa),
+               nsname   = name,
+               module   = mod,
+               version  = version,
+               isa      = isa,
+               variants = ''.join(f'"{i}", ' for i in variants))
+
 def buildpyext(bld     : Context,
                name    : str,
                version : str,
@@ -124,18 +163,11 @@ def buildpyext(bld     : Context,
     parent = copyroot(bld, name if len(pysrc) else None)
     target = parent.path_from(bld.bldnode.make_node(bld.path.relpath()))+"/"+mod
 
-    node   = bld(features = 'subst',
-                 source   = bld.srcnode.find_resource(__package__.replace('.', '/')
-                                                      +'/_module.template'),
-                 target   = name+"module.cpp",
-                 name     = str(bld.path)+":pybind11",
-                 nsname   = name,
-                 module   = mod,
-                 version  = version)
-    csrc.append(node.target)
+    isas   = list(bld.env.PYEXT_ISA or ())
+    node   = _pyextmodule(bld, name, version, mod, 'baseline', isas)
 
     args = copyargs(kwargs)
-    args.setdefault('source',   csrc)
+    args.setdefault('source',   [*csrc, node.target])
 
     args.setdefault('target',   target)
     args.setdefault('features', []).append('pyext')
@@ -143,3 +175,35 @@ def buildpyext(bld     : Context,
     args.update(**bld.installcodepath(name if pysrc else ""))
 
     bld.shlib(**args)
+
+    # the same sources, compiled for each ISA, in modules next to the baseline.
+    # Libraries in *use* are linked as they are: their code stays baseline.
+    for isa in isas:
+        node = _pyextmodule(bld, name, version, f'{mod}_{isa}', isa, ())
+        bld.shlib(**dict(
+            args,
+            source   = [*csrc, node.target],
+            target   = f'{target}_{isa}',
+            name     = f'{name}:pyext:{isa}',
+            features = list(args['features']),
+            cxxflags = [
+                *args.get('cxxflags', []),
+                *ISAS[isa][bld.env.COMPILER_CXX].split()
+            ]
+        ))
+
+    # linting depends on the stub, which only changes with the python API
+    stubgen = bld.srcnode.find_resource(__package__.replace('.', '/')+'/_pyextstub.py')
+    modname = name+'.'+mod if len(pysrc) else name
+    bld(features     = 'waitfor',
+        waitfor      = [name+':pyext'],
+        waitfor_deps = True,
+        rule         = lambda tsk: tsk.exec_command([
+            *tsk.env.PYTHON, stubgen.abspath(), modname,
+            tsk.dep_nodes[0].abspath(), tsk.outputs[0].abspath()
+        ]),
+        vars         = ['PYTHON'],
+        target       = parent.make_node(mod+'.pyi'),
+        name         = name+':pyi',
+        color        = 'BLUE',
+        cls_keyword  = lambda _: 'stubs')
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compiles a chunk of python files to bytecode in a single process: waf's
+scheduler runs the chunks in parallel.
+
+Usage: python _pycompile.py request.json
+
+The request is a json dictionnary with keys:
+
+* *invalidation*: either 'timestamp' or 'checked-hash'. The latter creates
+deterministic files, independant of the sources' modification times,
+* *items*: a list of [source, output, displayed path, optimization level].
+"""
+import sys
+import json
+import py_compile
+from   typing               import List, Optional, Sequence
+
+def _compile(item: Sequence) -> Optional[str]:
+    src, out, dfile, optimize, invalidation = item
+    kwargs = {}
+    mode   = getattr(py_compile, 'PycInvalidationMode', None)
+    if mode is not None:
+        kwargs['invalidation_mode'] = (
+            mode.CHECKED_HASH if invalidation == 'checked-hash' else mode.TIMESTAMP
+        )
+    try:
+        py_compile.compile(src, out, dfile, doraise = True, optimize = optimize, **kwargs)
+    except py_compile.PyCompileError as exc:
+        return exc.msg
+    return None
+
+def compileall(items: Sequence, invalidation = 'timestamp') -> List[str]:
+    "compiles the files, returning the errors"
+    outs = [_compile((*i, invalidation)) for i in items]
+    return [i for i in outs if i]
+
+def _main():
+    with open(sys.argv[1], 'r', encoding = 'utf-8') as stream:
+        req = json.load(stream)
+
+    errs = compileall(req['items'], req.get('invalidation', 'timestamp'))
+    for err in errs:
+        print(err, file = sys.stderr)
+    sys.exit(1 if errs else 0)
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Creates a *.pyi* stub for a python extension.
+
+The stub is permissive: everything is typed as *Any*. It lists the public
+names and, as comments, the signatures pybind11 writes in the docstrings. Its
+content thus changes only when the python-visible API does. Linting tasks
+depend on the stub rather than on the extension itself: c++ changes which
+leave the API untouched do not trigger linting again.
+
+Usage: python _pyextstub.py module.name path/to/extension.so path/to/output.pyi
+"""
+import re
+import sys
+import inspect
+import importlib.util
+from   typing   import List
+
+def _signatures(name: str, obj) -> List[str]:
+    patt = re.compile(r'^\s*(\d+\.\s*)?'+re.escape(name)+r'\(.*')
+    doc  = getattr(obj, '__doc__', None) or ''
+    sigs = [f'# {i.strip()}' for i in doc.split('\n') if patt.match(i)]
+    text = getattr(obj, '__text_signature__', None)
+    return sigs if sigs or not text else [f'# {name}{text}']
+
+def _function(name: str, obj, indent = '', method = False) -> List[str]:
+    args = 'self, *args: Any, **kwargs: Any' if method else '*args: Any, **kwargs: Any'
+    return [
+        *(indent+i for i in _signatures(name, obj)),
+        f'{indent}def {name}({args}) -> Any: ...'
+    ]
+
+def _class(name: str, cls) -> List[str]:
+    bases = [i.__name__ for i in cls.__bases__ if i.__module__ == 'builtins' and i is not object]
+    lines = [f'class {name}({", ".join(bases)}):' if bases else f'class {name}:']
+    for attr, obj in sorted(vars(cls).items()):
+        if attr.startswith('__') and attr not in ('__init__', '__call__'):
+            continue
+        if isinstance(obj, staticmethod):
+            lines += ['    @staticmethod', *_function(attr, obj.__func__, '    ')]
+        elif isinstance(obj, classmethod):
+            lines += ['    @classmethod', *_function(attr, obj.__func__, '    ', True)]
+        elif callable(obj) and not inspect.isclass(obj):
+            lines += _function(attr, obj, '    ', True)
+        else:
+            lines.append(f'    {attr}: Any')
+    lines += ['    def __getattr__(self, name: str) -> Any: ...', '']
+    return lines
+
+def stub(mod) -> str:
+    "returns the stub for a module"
+    lines = ['# generated by wafbuilder: do not edit', 'from typing import Any', '']
+    for name, obj in sorted(vars(mod).items()):
+        if name.startswith('__'):
+            continue
+        if inspect.isclass(obj):
+            lines += _class(name, obj)
+        elif callable(obj):
+            lines += _function(name, obj)
+        elif isinstance(obj, (bool, int, float, str)):
+            lines.append(f'{name}: {type(obj).__name__}')
+        else:
+            lines.append(f'{name}: Any')
+    return '\n'.join(lines)+'\n'
+
+def load(name: str, path: str):
+    "loads an extension from its path"
+    spec = importlib.util.spec_from_file_location(name, path)
+    mod  = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def _main():
+    name, path, out = sys.argv[1:4]
+    try:
+        txt = stub(load(name, path))
+    except Exception as exc: # pylint: disable=broad-except
+        print(f'could not load {name}: {exc!r}', file = sys.stderr)
+        txt = 'from typing import Any\ndef __getattr__(name: str) -> Any: ...\n'
+
+    with open(out, 'w', encoding = 'utf-8') as stream:
+        stream.write(txt)
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-lived pylint processes.
+
+Each worker process imports pylint once and lints batches of files: astroid's
+cache is shared by all files in a batch and, as much as pylint allows it, by
+consecutive batches. Messages are dispatched back per file, formatted using
+pylint's own text reporter, such that each waf task reports exactly what a
+`pylint file` call would have. To that effect, checkers comparing files with
+one another are disabled: their results would depend on the batches.
+
+The module is also the worker script: it then reads one json request per line
+on its stdin and answers with one json line.
+"""
+import os
+import io
+import sys
+import json
+import queue
+import atexit
+import threading
+import subprocess
+from   concurrent.futures import Future
+from   contextlib         import redirect_stdout
+from   typing             import Dict, List, Tuple, Optional
+
+try:
+    from ._lintcache      import Failure
+except ImportError:
+    Failure = None # the worker script needs none of it
+
+STATUS = {'I': 0, 'C': 16, 'R': 8, 'W': 4, 'E': 2, 'F': 1}
+
+# checkers which only report on files linted together: never in a per-file call
+CROSSFILE = ('duplicate-code', 'cyclic-import')
+
+class PyLintServer:
+    "dispatches files to lint to long-lived pylint processes"
+    BATCH = 32
+    def __init__(self):
+        self.python:  Optional[str]          = None
+        self.cwd:     Optional[str]          = None
+        self.workers: int                    = 0
+        self.queue:   queue.Queue            = queue.Queue()
+        self.threads: List[threading.Thread] = []
+        self.lock                            = threading.Lock()
+        atexit.register(self.stop)
+
+    def setup(self, python: Optional[str], workers: int, cwd: Optional[str] = None):
+        "sets the python executable, the number of workers and their directory"
+        self.python  = python
+        self.cwd     = cwd
+        self.workers = workers if python else 0
+        return self
+
+    def __bool__(self):
+        return self.workers > 0
+
+    def lint(self, path: str, args: List[str]) -> Tuple[int, str]:
+        "lints a file, relative to the workers' directory, returning the status and output"
+        self.__start()
+        fut: Future = Future()
+        self.queue.put((path, tuple(args), fut))
+        return fut.result()
+
+    def stop(self):
+        "stops the workers"
+        with self.lock:
+            for _ in self.threads:
+                self.queue.put(None)
+            for thr in self.threads:
+                thr.join()
+            self.threads.clear()
+
+    def __start(self):
+        with self.lock:
+            while len(self.threads) < self.workers:
+                self.threads.append(threading.Thread(target = self.__run, daemon = True))
+                self.threads[-1].start()
+
+    def __popen(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            [self.python, __file__],
+            cwd      = self.cwd,
+            stdin    = subprocess.PIPE,
+            stdout   = subprocess.PIPE,
+            encoding = 'utf-8',
+            bufsize  = 1
+        )
+
+    def __batch(self, first) -> list:
+        items = [first]
+        while len(items) < self.BATCH:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None or item[1] != first[1]:
+                self.queue.put(item)
+                break
+            items.append(item)
+        return items
+
+    def __run(self):
+        proc = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            items = self.__batch(item)
+            if proc is None or proc.poll() is not None:
+                proc = self.__popen()
+            try:
+                req = dict(args = items[0][1], files = [i[0] for i in items])
+                proc.stdin.write(json.dumps(req)+"\n")
+                proc.stdin.flush()
+                outs = json.loads(proc.stdout.readline())
+            except (OSError, ValueError) as exc:
+                for i in items:
+                    i[2].set_exception(exc)
+                proc.kill()
+                proc = None
+                continue
+
+            for path, _, fut in items:
+                # a third item means pylint itself failed
+                res = outs[path]
+                fut.set_result(Failure(*res[:2]) if len(res) > 2 else tuple(res))
+
+        if proc is not None:
+            proc.stdin.close()
+            proc.wait()
+
+def _lint(args: List[str], files: List[str]) -> Dict[str, Tuple[int, str]]:
+    "lints files in the current process"
+    # pylint: disable=import-outside-toplevel,import-error
+    from pylint                import __version__
+    from pylint.lint           import Run
+    from pylint.reporters.text import TextReporter
+
+    class _Reporter(TextReporter):
+        "dispatches messages per file"
+        def __init__(self):
+            super().__init__(io.StringIO())
+            self.outputs: Dict[str, io.StringIO] = {}
+            self.status:  Dict[str, int]         = {}
+
+        def handle_message(self, msg):
+            path     = os.path.abspath(getattr(msg, 'abspath', msg.path))
+            self.out = self.outputs.setdefault(path, io.StringIO())
+            self.status[path] = self.status.get(path, 0) | STATUS.get(msg.C, 0)
+            super().handle_message(msg)
+
+    rep  = _Reporter()
+    args = [*args, '--disable='+','.join(CROSSFILE)]
+    # pylint 2.5 renamed *do_exit* to *exit*
+    vers = tuple(int(i) for i in __version__.split('.')[:2] if i.isdigit())
+    kwa  = {'exit' if vers >= (2, 5) else 'do_exit': False}
+    # stdout is reserved for answering requests
+    with redirect_stdout(sys.stderr):
+        Run([*args, *files], reporter = rep, **kwa)
+
+    outs = {i: j.getvalue() for i, j in rep.outputs.items()}
+    full = {i: os.path.abspath(i) for i in files}
+    return {i: (rep.status.get(full[i], 0), outs.get(full[i], '')) for i in files}
+
+def _main():
+    for line in sys.stdin:
+        req = json.loads(line)
+        try:
+            out = _lint(list(req['args']), list(req['files']))
+        except (Exception, SystemExit) as exc: # pylint: disable=broad-except
+            out = {i: (1, f'pylint failed: {exc!r}', True) for i in req['files']}
+        print(json.dumps(out), flush = True)
+
+SERVER = PyLintServer()
+
+if __name__ == '__main__':
+    _main()
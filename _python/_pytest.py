@@ -2,8 +2,14 @@
 # -*- coding: utf-8 -*-
 "All python-testing related details"
 import os
+import sys
+import json
 from   pathlib   import Path
 from   importlib import import_module
+from   statistics import median
+from   concurrent.futures import ThreadPoolExecutor
+from   .._coverage import gcdadirs, removegcda
+from   . import _testdurations as durations
 
 class PyTesting:
     "All python-testing related details"
@@ -12,7 +18,13 @@ class PyTesting:
     COV     = 'coverage.cmdline'
     OMITS   = ["--omit", 'tests/*.py,*waf*.py,*test*.py']
     HTML    = "Coverage"
-    CAPTURE = "lcov --capture --directory ./ --output-file {output}"
+    WARM    = ("numpy", "pandas", "bokeh")
+    DURATIONS = "testdurations.db"
+    MEMPROFILE = "memprofile.json"
+    BENCHMARKS = "benchmarks"
+    BENCHMARK  = ('-m', 'benchmark')
+    CAPTURE = "lcov --capture --directory {input} --output-file {output}"
+    MERGE   = "lcov {inputs} --output-file {output}"
     REMOVE  = "lcov --remove {input} \"*/include/*\" --output-file {output}"
     GENHTML = "genhtml {input} --output-directory {output}"
     INDEX   = """
@@ -45,6 +57,40 @@ class PyTesting:
                 action  = "store_const",
                 const   = k
             )
+        grp.add_option(
+            '-b', '--benchmarks',
+            help    = (
+                "Run benchmark tests with warmup & repetitions, storing statistics"
+                " per git hash and comparing them with the baseline"
+            ),
+            dest    = "TEST_GROUP",
+            action  = "store_const",
+            const   = PyTesting.BENCHMARK
+        )
+        grp.add_option(
+            "--benchmark-baseline",
+            help    = (
+                "Compare benchmarks with the results for this git hash rather than"
+                " with the saved baseline"
+            ),
+            dest    = "BENCH_BASELINE",
+            default = "baseline",
+            action  = "store",
+        )
+        grp.add_option(
+            "--benchmark-save",
+            help    = "Save the benchmark results as the new baseline",
+            dest    = "BENCH_SAVE",
+            default = False,
+            action  = "store_true",
+        )
+        grp.add_option(
+            "--benchmark-threshold",
+            help    = "Fail on benchmarks slower than the baseline by more than this ratio",
+            dest    = "BENCH_THRESHOLD",
+            default = .1,
+            type    = "float",
+        )
         grp.add_option(
             "--pv",
             help    = f"verbose output",
@@ -64,6 +110,88 @@ class PyTesting:
             help    = f"Create a junit xml report at the provided path",
             dest    = "JUNIT_XML",
         )
+        grp.add_option(
+            "--test-jobs",
+            help    = (
+                "Run tests in that many worker processes, each file going to"
+                " the next idle worker"
+            ),
+            dest    = "TEST_JOBS",
+            default = 1,
+            type    = "int",
+        )
+        grp.add_option(
+            "--impacted",
+            help    = (
+                "Run only tests impacted by uncommitted changes. Only python imports"
+                " are followed, not c++ dependencies between modules"
+            ),
+            dest    = "TEST_IMPACTED",
+            default = None,
+            action  = "store_const",
+            const   = "HEAD",
+        )
+        grp.add_option(
+            "--impacted-since",
+            help    = (
+                "Run only tests impacted by changes since the merge base with"
+                " this git revision"
+            ),
+            dest    = "TEST_IMPACTED",
+            action  = "store",
+        )
+        grp.add_option(
+            "--fast",
+            help    = (
+                "Run only the tests, shortest first, which fit in that many seconds"
+                " according to previous runs. New tests are always run."
+            ),
+            dest    = "TEST_FAST",
+            default = None,
+            type    = "float",
+        )
+        grp.add_option(
+            "--durations-report",
+            help    = "Report tests much slower than the median of their previous runs",
+            dest    = "TEST_DURATIONS_REPORT",
+            default = False,
+            action  = "store_true",
+        )
+        grp.add_option(
+            "--memprofile",
+            help    = (
+                "Record per test the tracemalloc peak, the largest allocation sites"
+                " and the RSS peak, and check budgets set by @pytest.mark.memory."
+                f" Results are ranked in {PyTesting.MEMPROFILE}."
+            ),
+            dest    = "TEST_MEMPROFILE",
+            default = False,
+            action  = "store_true",
+        )
+        grp.add_option(
+            "--memprofile-top",
+            help    = "Number of tests to display in the memory report",
+            dest    = "TEST_MEMPROFILE_TOP",
+            default = 20,
+            type    = "int",
+        )
+        grp.add_option(
+            "--warm",
+            help    = (
+                "Run tests in a forked child of a long-lived process where heavy"
+                " modules are already imported"
+            ),
+            dest    = "TEST_WARM",
+            default = False,
+            action  = "store_true",
+        )
+        grp.add_option(
+            "--warm-imports",
+            help    = "Modules imported once and for all by the warm process",
+            dest    = "TEST_WARM_IMPORTS",
+            default = ",".join(PyTesting.WARM),
+            action  = "store",
+        )
         grp.add_option(
             "--coverage",
             help    = "Run tests with coverage",
@@ -102,14 +230,45 @@ class PyTesting:
             ]
             cmd.extend(args.split())
 
-        if not opt.TEST_COV:
-            import_module(cls.TEST).cmdline.main(cmd)
+        if getattr(opt, 'TEST_IMPACTED', None):
+            cmd = cls.__impacted(bld, cmd)
+            if cmd is None:
+                info("No test impacted by changes since %s", opt.TEST_IMPACTED)
+                return
+
+        if tuple(opt.TEST_GROUP) == cls.BENCHMARK:
+            # timings must not be disturbed by other processes or plugins
+            cls.__benchmarks(bld, cmd)
             return
 
-        for i in Path(".").glob("./**/*.gcda"):
-            i.unlink()
+        os.environ[durations.ENV] = str(Path(cls.DURATIONS).resolve())
+        if getattr(opt, 'TEST_FAST', None) is not None:
+            os.environ[durations.BUDGET] = str(opt.TEST_FAST)
+
+        plugins = ['-p', durations.__name__]
+        if getattr(opt, 'TEST_MEMPROFILE', False):
+            memprofile = import_module(__package__+'._memprofile')
+            os.environ[memprofile.ENV] = str(Path(cls.MEMPROFILE).resolve())
+            plugins   += ['-p', memprofile.__name__]
+
+        if getattr(opt, 'TEST_WARM', False) and hasattr(os, 'fork') and not opt.TEST_COV:
+            cls.__warm(opt, [*cmd, *plugins])
+        elif getattr(opt, 'TEST_JOBS', 1) > 1:
+            cls.__sharded(opt, cmd)
+        elif not opt.TEST_COV:
+            import_module(cls.TEST).cmdline.main([*cmd, *plugins])
+        else:
+            removegcda(".")
+            import_module(cls.COV).main(
+                ["run", "--parallel-mode", *cls.OMITS,
+                 "-m", cls.TEST, *cmd, *plugins]
+            )
+            import_module(cls.COV).main(["combine"])
 
-        import_module(cls.COV).main(["run", *cls.OMITS, "-m", cls.TEST, *cmd])
+        if getattr(opt, 'TEST_DURATIONS_REPORT', False):
+            cls.__regressions()
+        if getattr(opt, 'TEST_MEMPROFILE', False):
+            cls.__memreport(opt)
 
     @classmethod
     def html(cls, bld):
@@ -117,13 +276,16 @@ class PyTesting:
         from   waflib.Logs   import info
         os.chdir(cls.__outdir(bld))
         opt  = bld.options
-        gcda = any(Path(".").glob("./**/*.gcda"))
-        info("Found gcda files at %s: %s", Path(".").resolve(), gcda)
+        if any(Path(".").glob(".coverage.*")):
+            import_module(cls.COV).main(["combine"])
+
+        gcda = gcdadirs(".")
+        info("Found gcda files in %d directories of %s", len(gcda), Path(".").resolve())
         Path(opt.TEST_COV).mkdir(parents = True, exist_ok = True)
         out = opt.TEST_COV + ('/Python' if gcda else '')
         import_module(cls.COV).main(["html", "-i", *cls.OMITS, "-d", out])
         if gcda:
-            cls.__lcov(bld)
+            cls.__lcov(bld, gcda)
 
     @classmethod
     def make(cls, locs):
@@ -139,14 +301,133 @@ class PyTesting:
         )
 
     @classmethod
-    def __lcov(cls, bld):
-        "create lcov report"
-        cwd = Path(cls.__outdir(bld)).stem
-        opt = bld.options
+    def __sharded(cls, opt, cmd):
+        "runs tests in worker processes"
+        from   waflib.Logs      import info
+        from   ._pytestshard    import ShardedRun, collect, chunks
+        if opt.TEST_COV:
+            removegcda(".")
+
+        args = [i for i in cmd if i not in ('--junit-xml', opt.JUNIT_XML)]
+        meds = durations.TestDurations(cls.DURATIONS).medians()
+        dflt = median(meds.values()) if meds else 1.
+        code, ids, out = collect(sys.executable, args)
+        if code not in (0, 5) or not ids:
+            # collection errors or no tests: report as a plain run would
+            print(out, flush = True)
+            return code or 1
+
+        todo = chunks(ids, lambda x: meds.get(x, dflt))
+        info("Running %d test files in %d workers", len(todo), opt.TEST_JOBS)
+        return ShardedRun(sys.executable, opt.TEST_JOBS).run(
+            args,
+            todo,
+            junit    = opt.JUNIT_XML,
+            coverage = cls.OMITS if opt.TEST_COV else None
+        )
+
+    @staticmethod
+    def __warm(opt, cmd):
+        "runs tests in the warm process"
+        from   ._pytestwarm  import WarmClient, socketpath
+        addr = socketpath(Path("c4che")/"pytestwarm.txt")
+        imps = [i.strip() for i in opt.TEST_WARM_IMPORTS.split(',') if i.strip()]
+        return WarmClient(addr, imps).run(cmd)
+
+    @staticmethod
+    def __impacted(bld, cmd):
+        "replaces the tests directory by the impacted test files"
+        from   ._impacted   import impacted
+        src   = Path(str(getattr(bld, 'srcnode', bld.path)))/'tests'
+        found = impacted(bld, sorted(src.glob('**/*.py')), bld.options.TEST_IMPACTED)
+        if found is None:
+            return cmd
+        found = [i.relative_to(src.resolve()) for i in found]
+        found = [str(Path('tests')/i) for i in found if Path('tests', i).exists()]
+        return [*found, *cmd[1:]] if found else None
+
+    @classmethod
+    def __regressions(cls):
+        "reports tests slower than they used to be"
+        from   waflib.Logs   import info
+        found = durations.TestDurations(cls.DURATIONS).regressions()
+        info("%d tests are much slower than their previous median", len(found))
+        for node, dur, ref in found:
+            info("%8.2fs (median %8.2fs) %s", dur, ref, node)
+
+    @classmethod
+    def __benchmarks(cls, bld, cmd):
+        "runs benchmarks and compares them with the baseline"
+        from   waflib.Logs   import info, warn
+        from   ..git         import lasthash
+        bench = import_module(__package__+'._benchmarks')
+        opt   = bld.options
+        store = bench.BenchmarkStore(cls.BENCHMARKS)
+        path  = Path(cls.BENCHMARKS)/"current.json"
+        path.parent.mkdir(parents = True, exist_ok = True)
+        if path.exists():
+            path.unlink()
+
+        os.environ[bench.ENV] = str(path.resolve())
+        import_module(cls.TEST).cmdline.main([*cmd, '-p', bench.__name__])
+        if not path.exists():
+            warn("No benchmark results")
+            return
+
+        with open(path, 'r', encoding = 'utf-8') as stream:
+            found = json.load(stream)
+        store.save(lasthash() or 'nohash', found)
+
+        ref = store.load(opt.BENCH_BASELINE)
+        info("Benchmarks compared with %s", opt.BENCH_BASELINE if ref else "nothing")
+        for line in bench.report(found, ref):
+            info(line)
+
+        if opt.BENCH_SAVE:
+            store.save(bench.BASELINE, found)
+        elif ref:
+            bad = store.regressions(found, ref, opt.BENCH_THRESHOLD)
+            if bad:
+                bld.fatal(
+                    f"{len(bad)} benchmarks regressed by more than {opt.BENCH_THRESHOLD:.0%}:\n"
+                    + "\n".join(f"{i}: {j*1e6:.1f}us > {k*1e6:.1f}us" for i, j, k in bad)
+                )
+
+    @classmethod
+    def __memreport(cls, opt):
+        "reports tests using the most memory"
+        from   waflib.Logs   import info, error
+        from   ._memprofile  import merge, report
+        found = merge(cls.MEMPROFILE)
+        info("Memory use per test, python peak & RSS peak increase, in %s", cls.MEMPROFILE)
+        for line in report(found, opt.TEST_MEMPROFILE_TOP):
+            info(line)
+        for itm in (i for i in found if i['failed']):
+            error("Memory budget exceeded by %s", itm['nodeid'])
+
+    @classmethod
+    def __lcov(cls, bld, dirs):
+        "create lcov report, capturing each object directory in parallel"
+        cwd   = Path(cls.__outdir(bld)).stem
+        opt   = bld.options
+        parts = [f"cppcoverage-{i}.info" for i in range(len(dirs))]
+        with ThreadPoolExecutor(max(1, getattr(opt, 'jobs', 1) or 1)) as pool:
+            list(pool.map(
+                lambda x: bld.cmd_and_log(
+                    cls.CAPTURE.format(input = f'"{x[0]}"', output = x[1]),
+                    cwd = cwd
+                ),
+                zip(dirs, parts)
+            ))
         bld.cmd_and_log(
-            cls.CAPTURE.format(output = "cppcoverage.info"),
+            cls.MERGE.format(
+                inputs = " ".join(f"-a {i}" for i in parts),
+                output = "cppcoverage.info"
+            ),
             cwd = cwd
         )
+        for i in parts:
+            (Path(cwd)/i).unlink()
         bld.cmd_and_log(
             cls.REMOVE.format(input  = "cppcoverage.info", output = "cppfiltered.info"),
             cwd = cwd
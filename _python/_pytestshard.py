@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runs pytest in a number of worker processes.
+
+Tests are collected once, by a plugin, such that pytest's verbosity does not
+matter. They are grouped per file and put in a queue. Each worker
+collects the tests as well but runs only the files it is given, asking for a
+new one as soon as it is done: workers which are given quick files steal work
+from the others. Files are given longest first.
+
+Each worker writes its own junit xml and coverage data files. Both are merged
+once all workers are done. Worker outputs are printed one after the other,
+unchanged: failures are reported using pytest's own terminal reporter.
+
+The module is also the worker script: it then reads its configuration as a
+json line on stdin and connects to the coordinator using the provided address.
+"""
+import os
+import sys
+import json
+import queue
+import secrets
+import threading
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from   multiprocessing.connection import Listener, Client
+from   typing                     import Callable, Dict, List, Optional, Sequence, Tuple
+
+def collect(
+        python: str, args: Sequence[str], cwd: Optional[str] = None
+) -> Tuple[int, List[str], str]:
+    "returns pytest's status, the node ids of the tests to run and pytest's output"
+    out = subprocess.run(
+        [python, __file__],
+        cwd      = cwd,
+        input    = json.dumps(dict(collect = True, args = list(args)))+'\n',
+        stdout   = subprocess.PIPE,
+        stderr   = subprocess.STDOUT,
+        encoding = 'utf-8',
+        check    = False
+    )
+    # the node ids are the last line
+    lines = out.stdout.rstrip().split('\n')
+    try:
+        ids = [str(i) for i in json.loads(lines[-1])]
+    except (ValueError, TypeError):
+        return out.returncode or 1, [], out.stdout
+    return out.returncode, ids, '\n'.join(lines[:-1])
+
+def chunks(nodeids: Sequence[str], cost: Optional[Callable[[str], float]] = None) -> List[List[str]]:
+    "returns the tests grouped per file, most expensive first"
+    files: Dict[str, List[str]] = {}
+    for i in nodeids:
+        files.setdefault(i.split('::')[0], []).append(i)
+    if cost is None:
+        cost = lambda _: 1.
+    return sorted(files.values(), key = lambda x: -sum(cost(i) for i in x))
+
+def mergejunit(paths: Sequence[str], output: str):
+    "merges junit xml files into a single testsuite"
+    suite = ElementTree.Element('testsuite', name = 'pytest')
+    total = dict.fromkeys(('errors', 'failures', 'skipped', 'tests'), 0)
+    time  = 0.
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        root = ElementTree.parse(path).getroot()
+        for item in ([root] if root.tag == 'testsuite' else root.iter('testsuite')):
+            for key in total:
+                total[key] += int(item.get(key, 0))
+            time += float(item.get('time', 0.))
+            suite.extend(list(item))
+        os.remove(path)
+
+    suite.attrib.update({i: str(j) for i, j in total.items()}, time = f'{time:.3f}')
+    root = ElementTree.Element('testsuites')
+    root.append(suite)
+    ElementTree.ElementTree(root).write(output, encoding = 'utf-8', xml_declaration = True)
+
+class ShardedRun:
+    "runs tests in worker processes, dispatching files to idle workers"
+    def __init__(self, python: str, workers: int, cwd: Optional[str] = None):
+        self.python  = python
+        self.workers = workers
+        self.cwd     = cwd
+        self.queue: queue.Queue = queue.Queue()
+
+    def run(
+            self,
+            args:     Sequence[str],
+            todo:     Sequence[Sequence[str]],
+            junit:    Optional[str]           = None,
+            coverage: Optional[Sequence[str]] = None
+    ) -> int:
+        "runs the tests, printing outputs and returning pytest's status"
+        for i in todo:
+            self.queue.put(list(i))
+
+        key      = secrets.token_bytes(16)
+        listener = Listener(('127.0.0.1', 0), authkey = key)
+        accept   = threading.Thread(target = self.__accept, args = (listener,), daemon = True)
+        accept.start()
+
+        cnt      = max(1, min(self.workers, len(todo)))
+        outs     = [(0, '')]*cnt
+        def _worker(ind):
+            cmd  = (
+                [self.python, __file__] if coverage is None else
+                [self.python, '-m', 'coverage', 'run', '--parallel-mode', *coverage, __file__]
+            )
+            wargs = list(args)
+            if junit:
+                wargs += ['--junit-xml', f'{junit}.{ind}']
+            cfg  = dict(address = listener.address, authkey = key.hex(), args = wargs)
+            proc = subprocess.run(
+                cmd,
+                cwd      = self.cwd,
+                input    = json.dumps(cfg)+'\n',
+                stdout   = subprocess.PIPE,
+                stderr   = subprocess.STDOUT,
+                encoding = 'utf-8',
+                check    = False
+            )
+            outs[ind] = proc.returncode, proc.stdout
+
+        threads = [threading.Thread(target = _worker, args = (i,)) for i in range(cnt)]
+        for thr in threads:
+            thr.start()
+        for thr in threads:
+            thr.join()
+        listener.close()
+
+        for _, out in outs:
+            print(out, flush = True)
+
+        if junit:
+            mergejunit([f'{junit}.{i}' for i in range(cnt)], junit)
+        if coverage is not None:
+            subprocess.run([self.python, '-m', 'coverage', 'combine'], cwd = self.cwd, check = False)
+
+        codes = [i for i, _ in outs if i not in (0, 5)]
+        return 1 if 1 in codes else codes[0] if codes else outs[0][0]
+
+    def __accept(self, listener):
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target = self.__serve, args = (conn,), daemon = True).start()
+
+    def __serve(self, conn):
+        try:
+            while True:
+                conn.recv()
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    item = []
+                conn.send(item)
+                if not item:
+                    return
+        except (EOFError, OSError):
+            return
+        finally:
+            conn.close()
+
+def _collect(pytest, args: List[str]) -> int:
+    "prints the node ids on a last json line, whatever the verbosity"
+    class _Plugin:
+        "stores the collected node ids"
+        def __init__(self):
+            self.ids: List[str] = []
+
+        def pytest_collection_finish(self, session):
+            "stores the collected node ids"
+            self.ids.extend(i.nodeid for i in session.items)
+
+    plugin = _Plugin()
+    code   = pytest.main([*args, '--collect-only'], plugins = [plugin])
+    print('\n'+json.dumps(plugin.ids), flush = True)
+    return int(code)
+
+def _main():
+    # this directory contains a _pytest.py file: it must not hide pytest's own
+    here     = os.path.dirname(os.path.abspath(__file__))
+    sys.path = [i for i in sys.path if os.path.abspath(i or '.') != here]
+
+    # pylint: disable=import-outside-toplevel,import-error
+    import pytest
+
+    cfg  = json.loads(sys.stdin.readline())
+    if cfg.get('collect'):
+        sys.exit(_collect(pytest, cfg['args']))
+
+    conn = Client(tuple(cfg['address']), authkey = bytes.fromhex(cfg['authkey']))
+
+    class _Plugin:
+        "runs the tests provided by the coordinator"
+        @pytest.hookimpl(tryfirst = True)
+        def pytest_runtestloop(self, session):
+            "runs tests as provided by the coordinator"
+            if session.testsfailed and not session.config.option.continue_on_collection_errors:
+                raise session.Interrupted(f"{session.testsfailed} errors during collection")
+
+            items = {i.nodeid: i for i in session.items}
+            while True:
+                conn.send(None)
+                ids  = conn.recv()
+                if not ids:
+                    break
+                todo = [items[i] for i in ids if i in items]
+                for ind, item in enumerate(todo):
+                    nxt = todo[ind+1] if ind+1 < len(todo) else None
+                    item.config.hook.pytest_runtest_protocol(item = item, nextitem = nxt)
+                    if session.shouldfail:
+                        raise session.Failed(session.shouldfail)
+                    if session.shouldstop:
+                        raise session.Interrupted(session.shouldstop)
+            return True
+
+    plugins = [_Plugin()]
+    import importlib.util
+    for env, name in (
+            ('WAFBUILDER_TEST_DURATIONS', '_testdurations'),
+            ('WAFBUILDER_TEST_MEMPROFILE', '_memprofile')
+    ):
+        if not os.environ.get(env):
+            continue
+        spec = importlib.util.spec_from_file_location(name, os.path.join(here, name+'.py'))
+        mod  = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        plugins.append(mod)
+
+    try:
+        code = pytest.main(cfg['args'], plugins = plugins)
+    finally:
+        conn.close()
+    sys.exit(int(code))
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A long-lived process running pytest with heavy modules already imported.
+
+The server imports pytest and the configured modules (numpy, pandas, bokeh,
+python extensions, ...) once. Each test run is a forked child, such that runs
+are isolated from one another while starting warm. The child's output is sent
+back to the client as it comes.
+
+The server is started with the client's python path, the build directory
+first, such that python extensions are imported from where the tests would.
+Imports which fail are reported with each run.
+
+Before each run, the server checks the modification times of all the files
+it imported, python extensions included, and whether the imports which failed
+can now be found. Should any have changed, or should the requested imports or
+python path differ, it exits and the client starts a new one. Modules imported
+by the tests only are imported anew by each child: they are never stale.
+
+The socket lives in a directory private to the user: either in
+`$XDG_RUNTIME_DIR` or in a temporary directory recorded in the build
+directory. Connections are authenticated using a random key stored next to the
+socket, readable by the user only. Only the environment variables starting
+with one of *ENVIRON* are sent to the server. Tests otherwise see the environment of the
+session which started the server.
+
+The module is also the server script:
+
+    python _pytestwarm.py socket-path module1 module2 ...
+
+with the python path in the *PATHENV* environment variable.
+"""
+import os
+import sys
+import json
+import stat
+import time
+import hashlib
+import secrets
+import tempfile
+import traceback
+import importlib.util
+import subprocess
+from   multiprocessing            import AuthenticationError
+from   multiprocessing.connection import Listener, Client
+from   pathlib                    import Path
+from   typing                     import Dict, List, Optional, Sequence
+
+ENVIRON = (
+    'PATH', 'LD_LIBRARY_PATH', 'HOME', 'LANG', 'LC_', 'TZ',
+    'PYTHON', 'PYTEST', 'COVERAGE', 'WAFBUILDER_', 'DPX_'
+)
+PATHENV = 'WAFBUILDER_WARM_PATH'
+
+def _forwarded(name: str) -> bool:
+    return name.startswith(ENVIRON)
+
+def _isprivate(path: Path, mode: int) -> bool:
+    "whether the path belongs to the user, with no access for others"
+    try:
+        info = path.lstat()
+    except OSError:
+        return False
+    return info.st_uid == os.getuid() and stat.S_IMODE(info.st_mode) & ~mode == 0
+
+def socketpath(record: Path) -> str:
+    "returns the socket path, in a directory private to the user"
+    key = hashlib.md5(str(Path('.').resolve()).encode('utf-8')).hexdigest()[:12]
+    run = os.environ.get('XDG_RUNTIME_DIR')
+    if run and _isprivate(Path(run), 0o700):
+        root = Path(run)/'wafbuilder'
+        root.mkdir(mode = 0o700, exist_ok = True)
+        if _isprivate(root, 0o700):
+            return str(root/f'pytest-{key}.sock')
+
+    # unix sockets have a short maximum path length: the build directory might be too deep
+    try:
+        root = Path(record.read_text(encoding = 'utf-8').strip())
+    except OSError:
+        root = None
+    if root is None or not root.is_absolute() or not _isprivate(root, 0o700):
+        root = Path(tempfile.mkdtemp(prefix = 'wafbuilder-pytest-'))
+        record.parent.mkdir(parents = True, exist_ok = True)
+        record.write_text(str(root), encoding = 'utf-8')
+    return str(root/f'pytest-{key}.sock')
+
+def authkey(address: str, create: bool = True) -> bytes:
+    "returns the key authenticating connections, readable by the user only"
+    path = Path(address+'.key')
+    if _isprivate(path, 0o600):
+        key = path.read_bytes()
+        if len(key) == 32:
+            return key
+    if not create:
+        raise RuntimeError(f"Missing or unsafe key: {path}")
+
+    if path.exists() or path.is_symlink():
+        path.unlink()
+    key = secrets.token_bytes(32)
+    fid = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fid, 'wb') as stream:
+        stream.write(key)
+    return key
+
+def _files() -> Dict[str, float]:
+    out = {}
+    for mod in list(sys.modules.values()):
+        path = getattr(mod, '__file__', None)
+        if path and os.path.exists(path):
+            out[path] = os.path.getmtime(path)
+    return out
+
+def _isstale(files: Dict[str, float], failed: Dict[str, str]) -> bool:
+    for path, mtime in files.items():
+        try:
+            if os.path.getmtime(path) != mtime:
+                return True
+        except OSError:
+            return True
+
+    if failed:
+        # a python extension may have been built since
+        importlib.invalidate_caches()
+        for name in failed:
+            try:
+                if importlib.util.find_spec(name.split('.')[0]) is not None:
+                    return True
+            except (ImportError, ValueError):
+                pass
+    return False
+
+class WarmClient:
+    "runs tests through the warm server, starting it if needed"
+    def __init__(self, address: str, imports: Sequence[str], python: str = sys.executable):
+        self.address = address
+        self.imports = sorted(imports)
+        self.python  = python
+
+    def run(self, args: Sequence[str], cwd: Optional[str] = None) -> int:
+        "runs pytest, printing its output, and returns its status"
+        cwd  = cwd or os.getcwd()
+        path = [cwd, *(i for i in sys.path if i != cwd)]
+        for _ in range(2):
+            conn = self.__connect(path)
+            try:
+                conn.send(dict(
+                    imports = self.imports,
+                    args    = list(args),
+                    cwd     = cwd,
+                    env     = {i: j for i, j in os.environ.items() if _forwarded(i)},
+                    path    = path
+                ))
+                while True:
+                    kind, val = conn.recv()
+                    if kind == 'out':
+                        sys.stdout.write(val)
+                        sys.stdout.flush()
+                    elif kind == 'exit':
+                        return val
+                    else: # stale: the server exits
+                        break
+            except EOFError:
+                pass
+            finally:
+                conn.close()
+            self.__wait()
+        raise RuntimeError("Could not run tests on the warm server")
+
+    def __connect(self, path: List[str]):
+        key = authkey(self.address)
+        try:
+            return Client(self.address, family = 'AF_UNIX', authkey = key)
+        except (OSError, AuthenticationError):
+            pass
+
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        key = authkey(self.address)
+        with open(self.address+'.log', 'w', encoding = 'utf-8') as log:
+            subprocess.Popen( # pylint: disable=consider-using-with
+                [self.python, __file__, self.address, *self.imports],
+                stdin             = subprocess.DEVNULL,
+                stdout            = log,
+                stderr            = subprocess.STDOUT,
+                start_new_session = True,
+                env               = dict(os.environ, **{PATHENV: json.dumps(path)})
+            )
+        for _ in range(600):
+            try:
+                return Client(self.address, family = 'AF_UNIX', authkey = key)
+            except OSError:
+                time.sleep(.1)
+        raise RuntimeError("Could not start the warm server")
+
+    def __wait(self):
+        for _ in range(100):
+            if not os.path.exists(self.address):
+                return
+            time.sleep(.05)
+
+def _child(conn, req) -> int:
+    "runs pytest in the forked process"
+    rfd, wfd = os.pipe()
+    pid      = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        os.dup2(wfd, 1)
+        os.dup2(wfd, 2)
+        code = 1
+        try:
+            os.chdir(req['cwd'])
+            for name in [i for i in os.environ if _forwarded(i)]:
+                del os.environ[name]
+            os.environ.update(req['env'])
+            sys.stdout  = os.fdopen(1, 'w', buffering = 1)
+            sys.stderr  = os.fdopen(2, 'w', buffering = 1)
+
+            import pytest # pylint: disable=import-outside-toplevel,import-error
+            code = int(pytest.main(req['args']))
+        except BaseException: # pylint: disable=broad-except
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code) # pylint: disable=protected-access
+
+    os.close(wfd)
+    with os.fdopen(rfd, 'r', encoding = 'utf-8', errors = 'replace') as stream:
+        for line in stream:
+            conn.send(('out', line))
+    status = os.waitpid(pid, 0)[1]
+    return os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+
+def _main(address: str, imports: List[str]):
+    # modules are preloaded from where the tests will import them
+    path     = json.loads(os.environ.pop(PATHENV, '[]'))
+    # this directory contains a _pytest.py file: it must not hide pytest's own
+    here     = os.path.dirname(os.path.abspath(__file__))
+    sys.path = [
+        i for i in path + [j for j in sys.path if j not in path]
+        if os.path.abspath(i or '.') != here
+    ]
+
+    failed: Dict[str, str] = {}
+    for name in ['pytest', *imports]:
+        try:
+            importlib.import_module(name)
+        except Exception as exc: # pylint: disable=broad-except
+            failed[name] = f"warm server could not import {name}: {exc!r}\n"
+            traceback.print_exc()
+    files = _files()
+
+    listener = Listener(address, family = 'AF_UNIX', authkey = authkey(address, False))
+    try:
+        while True:
+            conn = listener.accept()
+            try:
+                req = conn.recv()
+                if (
+                        req['imports'] != sorted(imports)
+                        or req['path'] != path
+                        or _isstale(files, failed)
+                ):
+                    conn.send(('stale', None))
+                    break
+                for msg in failed.values():
+                    conn.send(('out', msg))
+                conn.send(('exit', _child(conn, req)))
+            except (EOFError, OSError):
+                pass
+            finally:
+                conn.close()
+    finally:
+        listener.close()
+
+if __name__ == '__main__':
+    _main(sys.argv[1], sys.argv[2:])
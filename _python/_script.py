@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 "All *basic* python related details"
 from pathlib            import Path
-from typing             import Sequence, List, Tuple
+from typing             import Sequence, List, Optional, Tuple
 from waflib.Configure   import conf
 from waflib.Context     import Context
 from ..git              import (
@@ -17,6 +17,8 @@ from ._numpy            import Numpy
 from ._base             import toload
 from ._linting          import Linting
 from ._conda            import CondaSetup
+from ._manifest         import MANIFEST
+from ._bytecode         import ByteCode
 
 IS_MAKE = YES
 TESTS   = "__tests__", "tests"
@@ -29,17 +31,31 @@ def configure(cnf:Context):
     CondaSetup.configure(cnf)
     load(cnf)  # type: ignore # pylint: disable=undefined-variable
 
-def removeunknowns(bld:Context, name:str):
-    "remove unknown python files"
+def removeunknowns(bld:Context, name:str, files: Optional[Sequence[str]] = None):
+    """
+    remove unknown python files.
+
+    With *files*, the paths copied to the module's build directory, stale files
+    are those copied in the previous build but no longer: they are found in the
+    manifest rather than by walking the build directory.
+    """
     srcpath = Path(str(bld.path))
     bldpath = Path(str(bld.bldnode))/name
     ind     = len(str(bldpath))+1
-    vals    = [val for val in bldpath.glob("**/*.py")
-               if not (srcpath/str(val)[ind:]).exists()]
+    unknown = lambda: (str(val)[ind:] for val in bldpath.glob("**/*.py")
+                       if not (srcpath/str(val)[ind:]).exists())
+    if files is None:
+        vals = [bldpath/i for i in unknown()]
+    else:
+        if MANIFEST.setup(Path(bld.out_dir)/"c4che"/"pymanifest.json"):
+            bld.add_post_fun(lambda _: MANIFEST.save())
+        vals = [bldpath/i for i in MANIFEST.stale(name, files, unknown)]
+
     if len(vals):
         def _rem(*_):
             for path in vals:
-                path.unlink()
+                if path.exists():
+                    path.unlink()
                 cache = path.parent/"__pycache__"
                 for j in cache.glob(path.stem+".*"):
                     Path(cache/j).unlink()
@@ -74,7 +90,8 @@ def _pymod_build(bld, name, pysrc, doremove):
     copyfiles(bld, TESTS[1], testlist)
 
     if doremove:
-        removeunknowns(bld, name)
+        root = copyroot(bld, name)
+        removeunknowns(bld, name, [i.path_from(root) for _, i in srclist])
 
     bld(
         name         = str(bld.path)+":py",
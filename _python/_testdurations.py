@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A database of test durations and outcomes.
+
+Each run of the tests is recorded in a sqlite file in the build directory.
+Only the last *KEEP* runs of each test are kept. The rolling median of a
+test's last durations is used:
+
+* for balancing parallel runs, longest tests first,
+* for selecting tests fitting in a time budget,
+* for reporting tests which took much longer than they used to.
+
+The pytest plugin *Recorder* is loaded by the tests' process, whether it be
+waf itself or the workers of a parallel run. It is configured using
+environment variables such that the latter inherit it.
+"""
+import os
+import time
+import sqlite3
+from   statistics   import median
+from   typing       import Dict, List, Optional, Tuple
+
+ENV    = 'WAFBUILDER_TEST_DURATIONS'
+BUDGET = 'WAFBUILDER_TEST_BUDGET'
+
+class TestDurations:
+    "durations & outcomes per test and per run"
+    WINDOW = 10
+    KEEP   = 2*WINDOW
+    def __init__(self, path: str):
+        self.path = path
+        with self.__connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS durations"
+                " (nodeid TEXT, time REAL, duration REAL, outcome TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS nodes ON durations (nodeid, time)")
+
+    def add(self, results: Dict[str, Tuple[float, str]], stamp: Optional[float] = None):
+        "adds the durations & outcomes of a run"
+        stamp = time.time() if stamp is None else stamp
+        with self.__connect() as conn:
+            conn.executemany(
+                "INSERT INTO durations VALUES (?, ?, ?, ?)",
+                [(i, stamp, j, k) for i, (j, k) in results.items()]
+            )
+            conn.executemany(
+                "DELETE FROM durations WHERE nodeid = ? AND time < ("
+                " SELECT time FROM durations WHERE nodeid = ?"
+                " ORDER BY time DESC LIMIT 1 OFFSET ?"
+                ")",
+                [(i, i, self.KEEP-1) for i in results]
+            )
+
+    def history(self, window: int = WINDOW) -> Dict[str, List[float]]:
+        "returns the last durations per test, the latest first"
+        out: Dict[str, List[float]] = {}
+        with self.__connect() as conn:
+            if sqlite3.sqlite_version_info >= (3, 25):
+                rows = conn.execute(
+                    "SELECT nodeid, duration FROM ("
+                    " SELECT nodeid, duration, time, ROW_NUMBER() OVER"
+                    " (PARTITION BY nodeid ORDER BY time DESC) AS rank FROM durations"
+                    ") WHERE rank <= ? ORDER BY nodeid, time DESC",
+                    (window,)
+                )
+            else:
+                rows = conn.execute(
+                    "SELECT nodeid, duration FROM durations ORDER BY nodeid, time DESC"
+                )
+            for node, dur in rows:
+                itms = out.setdefault(node, [])
+                if len(itms) < window:
+                    itms.append(dur)
+        return out
+
+    def medians(self, window: int = WINDOW) -> Dict[str, float]:
+        "returns the rolling median per test"
+        return {i: median(j) for i, j in self.history(window).items()}
+
+    def regressions(
+            self,
+            ratio:   float = 1.5,
+            minimum: float = .1,
+            window:  int   = WINDOW
+    ) -> List[Tuple[str, float, float]]:
+        "returns tests with a latest duration much above their previous median"
+        out = []
+        for node, durs in self.history(window+1).items():
+            if len(durs) < 2:
+                continue
+            ref = median(durs[1:])
+            if durs[0] > ref*ratio and durs[0]-ref > minimum:
+                out.append((node, durs[0], ref))
+        return sorted(out, key = lambda x: x[2]-x[1])
+
+    def select(self, nodeids: List[str], budget: float) -> List[str]:
+        "returns the tests fitting in the budget, shortest first. Unknown tests are kept."
+        meds  = self.medians()
+        found = [i for i in nodeids if i not in meds]
+        total = 0.
+        for node in sorted((i for i in nodeids if i in meds), key = meds.__getitem__):
+            total += meds[node]
+            if total > budget:
+                break
+            found.append(node)
+        return found
+
+    def __connect(self):
+        return sqlite3.connect(self.path, timeout = 60.)
+
+class Recorder:
+    "a pytest plugin recording durations & outcomes"
+    def __init__(self, path: str, budget: Optional[float] = None):
+        self.database = TestDurations(path)
+        self.budget   = budget
+        self.results: Dict[str, Tuple[float, str]] = {}
+
+    def pytest_collection_modifyitems(self, config, items):
+        "keeps only tests fitting in the time budget"
+        if self.budget is None:
+            return
+        keep = set(self.database.select([i.nodeid for i in items], self.budget))
+        drop = [i for i in items if i.nodeid not in keep]
+        if drop:
+            config.hook.pytest_deselected(items = drop)
+            items[:] = [i for i in items if i.nodeid in keep]
+
+    def pytest_runtest_logreport(self, report):
+        "adds up the setup, call & teardown durations"
+        dur, outcome = self.results.get(report.nodeid, (0., 'passed'))
+        if report.when == 'call' or report.outcome != 'passed':
+            outcome = report.outcome if outcome == 'passed' else outcome
+        self.results[report.nodeid] = dur + report.duration, outcome
+
+    def pytest_sessionfinish(self, session): # pylint: disable=unused-argument
+        "stores the results"
+        if self.results:
+            self.database.add(self.results)
+
+def recorder() -> Optional[Recorder]:
+    "returns a recorder configured from the environment, if any"
+    path = os.environ.get(ENV)
+    if not path:
+        return None
+    budget = os.environ.get(BUDGET)
+    return Recorder(path, float(budget) if budget else None)
+
+def pytest_configure(config):
+    "registers the recorder when loaded using `-p`"
+    plugin = recorder()
+    if plugin is not None:
+        config.pluginmanager.register(plugin, 'wafbuilder-durations')
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+u"""
+Resource-aware scheduling of waf tasks.
+
+Waf defaults to as many jobs as there are cores on the machine, ignoring
+container quotas. Here:
+
+* the default number of jobs is limited by the cgroup (v1 or v2) cpu quota,
+* heavy tasks (c++ compilation & linking, pylint, mypy, bokeh) share a
+memory budget limited by the cgroup memory limit. Each task class has a memory
+estimate which is either provided using `--task-memory` or learned from
+previous builds: the largest peak seen per task class, slowly decayed such
+that small incremental builds barely lower it.
+
+The memory budget is enforced using waf's own *semaphore* mechanism: a task
+is started only if its estimate fits in what is left of the budget. One
+heavy task is always allowed to run, whatever its estimate.
+"""
+import os
+import sys
+import json
+import threading
+import subprocess
+from   math             import ceil
+from   pathlib          import Path
+from   typing           import Dict, Optional, Set
+from   waflib           import Utils
+from   waflib.Logs      import info
+from   waflib.Task      import Task
+from   waflib.TaskGen   import feature, after_method
+from   ._utils          import Make
+
+try:
+    import resource
+except ImportError: # windows
+    resource = None # type: ignore
+
+CGROUP  = Path("/sys/fs/cgroup")
+MEGA    = 1024*1024
+RESERVE = .9
+DECAY   = .95
+TASKS   = {
+    'compile': 1000,
+    'link':    2000,
+    'pylint':  300,
+    'mypy':    500,
+    'bokeh':   1000,
+}
+
+def _read(*paths: Path) -> Optional[str]:
+    for path in paths:
+        try:
+            return path.read_text().strip()
+        except (OSError, ValueError):
+            continue
+    return None
+
+def cpuquota(root: Path = CGROUP) -> Optional[float]:
+    "returns the cgroup cpu quota, in number of cores, or None if unlimited"
+    val = _read(root/"cpu.max")
+    if val is not None:
+        quota, period = (val.split()+['100000'])[:2]
+        return None if quota == 'max' else int(quota)/int(period)
+
+    quota  = _read(root/"cpu"/"cpu.cfs_quota_us", root/"cpu,cpuacct"/"cpu.cfs_quota_us")
+    period = _read(root/"cpu"/"cpu.cfs_period_us", root/"cpu,cpuacct"/"cpu.cfs_period_us")
+    if quota is None or period is None or int(quota) <= 0:
+        return None
+    return int(quota)/int(period)
+
+def memlimit(root: Path = CGROUP) -> Optional[int]:
+    "returns the memory limit in MB: the cgroup's or the physical memory"
+    val = _read(root/"memory.max", root/"memory"/"memory.limit_in_bytes")
+    phys: Optional[int] = None
+    if hasattr(os, 'sysconf') and 'SC_PHYS_PAGES' in os.sysconf_names:
+        phys = os.sysconf('SC_PHYS_PAGES')*os.sysconf('SC_PAGE_SIZE')//MEGA
+
+    if val is None or not val.isdigit():
+        return phys
+    # cgroup v1 reports a huge number when unlimited
+    return int(val)//MEGA if phys is None else min(phys, int(val)//MEGA)
+
+def jobs() -> int:
+    "returns the number of jobs allowed by the cpu count and the cgroup quota"
+    count = os.cpu_count() or 1
+    quota = cpuquota()
+    return count if quota is None else max(1, min(count, ceil(quota)))
+
+def category(tsk) -> Optional[str]:
+    "returns the resource category of a task"
+    name = type(tsk).__name__
+    if name in ('c', 'cxx'):
+        return 'compile'
+    if name.startswith(('c', 'cxx')) and name.endswith(('program', 'shlib', 'stlib')):
+        return 'link'
+    kwd = str(tsk.keyword()).lower()
+    return kwd if kwd in TASKS else None
+
+class _Waiting(set):
+    "tasks waiting for memory: the largest one fitting in the budget is popped first"
+    def __init__(self, sem: 'ResourceSemaphore'):
+        super().__init__()
+        self.sem = sem
+
+    def pop(self):
+        itms = [i for i in self if self.sem.fits(i)] or list(self)
+        tsk  = max(itms, key = self.sem.estimate)
+        self.remove(tsk)
+        return tsk
+
+class ResourceSemaphore:
+    "A waf task semaphore sharing a memory budget between heavy tasks"
+    def __init__(self, budget: int, estimates: Dict[str, int]):
+        self.budget             = budget
+        self.estimates          = dict(estimates)
+        self.locking: Set[Task] = set()
+        self.waiting            = _Waiting(self)
+
+    def estimate(self, tsk) -> int:
+        "the memory estimate for a task, in MB"
+        return self.estimates.get(category(tsk), 0)
+
+    def used(self) -> int:
+        "the memory currently reserved by running tasks"
+        return sum(self.estimate(i) for i in self.locking)
+
+    def fits(self, tsk) -> bool:
+        "whether the task can start now"
+        return not self.locking or self.used() + self.estimate(tsk) <= self.budget
+
+    def is_locked(self) -> bool:
+        "whether no waiting task can start"
+        if self.waiting:
+            return not any(self.fits(i) for i in self.waiting)
+        return self.used() >= self.budget
+
+    def acquire(self, tsk):
+        "reserves the task's memory"
+        if not self.fits(tsk):
+            raise IndexError(f'Cannot lock more {self.locking!r}')
+        self.locking.add(tsk)
+
+    def release(self, tsk):
+        "frees the task's memory"
+        self.locking.remove(tsk)
+
+class Scheduler(Make):
+    "limits the jobs & concurrent heavy tasks to the cgroup quotas"
+    FILE = "taskresources.json"
+
+    @staticmethod
+    def options(opt):
+        "add options"
+        if 'JOBS' not in os.environ:
+            opt.parser.set_defaults(jobs = jobs())
+
+        grp = opt.add_option_group('Scheduler Options')
+        grp.add_option(
+            '--memory-limit',
+            dest    = 'MEMORY_LIMIT',
+            default = None,
+            type    = 'int',
+            action  = 'store',
+            help    = "memory available to heavy tasks, in MB (defaults to the cgroup limit)"
+        )
+        grp.add_option(
+            '--task-memory',
+            dest    = 'TASK_MEMORY',
+            default = '',
+            action  = 'store',
+            help    = (
+                "memory estimates, in MB, per task type: "
+                + ','.join(f'{i}:{j}' for i, j in TASKS.items())
+                + ". Missing values are learned from previous builds."
+            )
+        )
+        grp.add_option(
+            '--no-resource-limits',
+            dest    = 'RESOURCE_LIMITS',
+            default = True,
+            action  = 'store_false',
+            help    = "do not limit heavy tasks to the available memory"
+        )
+
+    @classmethod
+    def build(cls, bld):
+        "sets-up the semaphore"
+        opts = bld.options
+        if not getattr(opts, 'RESOURCE_LIMITS', False) or getattr(bld, 'resources', None):
+            return
+
+        budget = getattr(opts, 'MEMORY_LIMIT', None)
+        if not budget:
+            budget = int((memlimit() or 0)*RESERVE)
+        if not budget:
+            return
+
+        path      = Path(bld.out_dir)/"c4che"/cls.FILE
+        estimates = dict(TASKS, **cls.__load(path))
+        estimates.update(
+            (i.split(':')[0].strip(), int(i.split(':')[1]))
+            for i in getattr(opts, 'TASK_MEMORY', '').split(',') if ':' in i
+        )
+
+        bld.resources       = ResourceSemaphore(budget, estimates)
+        bld.resources_peaks = {}
+        info("Memory budget for heavy tasks: %d MB", budget)
+
+        # commands must be children of this process for their peak memory to be known
+        Utils.run_process = run_process if hasattr(os, 'wait4') else Utils.run_regular_process
+        bld.add_post_fun(lambda x: cls.__save(path, x.resources_peaks))
+
+    @staticmethod
+    def __load(path: Path) -> Dict[str, int]:
+        try:
+            with open(path, 'r', encoding = 'utf-8') as stream:
+                return {i: int(j) for i, j in json.load(stream).items() if i in TASKS}
+        except (OSError, ValueError):
+            return {}
+
+    @classmethod
+    def __save(cls, path: Path, peaks: Dict[str, int]):
+        if not peaks:
+            return
+        # a small incremental build must not lower the estimates much
+        vals = cls.__load(path)
+        vals.update({i: max(j, int(vals.get(i, 0)*DECAY)) for i, j in peaks.items()})
+        with open(path, 'w', encoding = 'utf-8') as stream:
+            json.dump(vals, stream)
+
+@feature('*')
+@after_method('process_source', 'process_rule', 'apply_link')
+def apply_resources(self):
+    "heavy tasks share the memory budget"
+    sem = getattr(self.bld, 'resources', None)
+    if sem is None:
+        return
+    for tsk in self.tasks:
+        if category(tsk) is not None:
+            tsk.semaphore = sem
+
+_PEAK = threading.local()
+
+class _Popen(subprocess.Popen):
+    "stores the child's own peak memory when reaping it"
+    maxrss = 0
+    def _try_wait(self, wait_flags):
+        try:
+            pid, sts, usage = os.wait4(self.pid, wait_flags) # pylint: disable=no-member
+        except ChildProcessError:
+            return self.pid, 0
+        if pid == self.pid:
+            self.maxrss = usage.ru_maxrss
+        return pid, sts
+
+def run_process(cmd, kwargs, cargs = None):
+    "waf's *run_regular_process*, keeping track of the child's peak memory"
+    cargs = cargs or {}
+    proc  = _Popen(cmd, **kwargs)
+    try:
+        if kwargs.get('stdout') or kwargs.get('stderr'):
+            out, err = proc.communicate(**cargs)
+        else:
+            out, err = None, None
+            proc.wait(**cargs)
+    except subprocess.TimeoutExpired:
+        if kwargs.get('start_new_session') and hasattr(os, 'killpg'):
+            os.killpg(proc.pid, 9)
+        else:
+            proc.kill()
+        proc.communicate()
+        raise
+    finally:
+        # a task may run more than one command
+        _PEAK.value = max(getattr(_PEAK, 'value', 0), proc.maxrss)
+    return proc.returncode, out, err
+
+def exec_command(self, cmd, __old__ = Task.exec_command, **kw):
+    """
+    execute cmd, keeping track of the child's memory peak.
+
+    Each child is reaped using *wait4*, which provides its own *ru_maxrss*:
+    peaks are attributed to the task which ran the command, whatever the
+    other tasks running in parallel.
+    """
+    bld = getattr(getattr(self, 'generator', None), 'bld', None)
+    if resource is None or getattr(bld, 'resources', None) is None:
+        return __old__(self, cmd, **kw)
+
+    _PEAK.value = 0
+    try:
+        return __old__(self, cmd, **kw)
+    finally:
+        name = category(self)
+        if _PEAK.value and name is not None:
+            # linux reports kB, macos reports bytes
+            peak  = _PEAK.value // (MEGA if sys.platform == 'darwin' else 1024)
+            peaks = bld.resources_peaks
+            peaks[name] = max(peaks.get(name, 0), int(peak*1.1))
+Task.exec_command = exec_command
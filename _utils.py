@@ -11,6 +11,7 @@ from functools      import wraps
 
 from waflib.Context   import Context
 from waflib.Configure import conf
+from waflib.TaskGen   import feature, after_method
 
 YES = type('YES', (object,), dict(__doc__ = "Used as a typed enum"))()
 
@@ -249,6 +250,33 @@ def copyfiles(bld:Context, arg, items:Sequence, install = False):
             target      = [tgt],
             cls_keyword = _kword)
 
+@feature('waitfor')
+@after_method('process_rule', 'process_source')
+def apply_waitfor(self):
+    """
+    Tasks wait for those of other task generators rather than for whole build
+    groups. The attribute *waitfor* is either a list of task generator names or
+    a predicate over task generators. With *waitfor_deps* set, the outputs of
+    the last task of each generator are also added to the dependencies. It can
+    also be a predicate selecting the generators concerned.
+    """
+    waitfor = getattr(self, 'waitfor', [])
+    deps    = getattr(self, 'waitfor_deps', False)
+    if callable(waitfor):
+        tgens = [i for i in self.bld.get_all_task_gen() if i is not self and waitfor(i)]
+    else:
+        tgens = [self.bld.get_tgen_by_name(i) for i in self.to_list(waitfor)]
+
+    for tgen in tgens:
+        tgen.post()
+        if not tgen.tasks:
+            continue
+        for tsk in self.tasks:
+            for other in tgen.tasks:
+                tsk.set_run_after(other)
+            if deps(tgen) if callable(deps) else deps:
+                tsk.dep_nodes.extend(tgen.tasks[-1].outputs)
+
 def copyargs(kwa):
     "Copies args to make, discarding some specific to the latter"
     args = dict(kwa)
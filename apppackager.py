@@ -14,6 +14,7 @@ from ._utils          import CODE_PATH, copyfiles
 from .bokehcompiler   import build_bokehjs
 from .git             import version as _version
 from .modules         import basecontext
+from ._profile        import saveappcmdlines
 
 def build_resources(bld):
     "install resources in installation directory"
@@ -75,6 +76,7 @@ def build_startupscripts(bld, name, scriptname):
             ))
         elif not debug:
             bld(**args)
+    saveappcmdlines(bld, scriptname)
 
 def build_doc(bld, scriptname):
     "create the doc"
@@ -196,7 +198,6 @@ def build_appenv(bld):
     build_resources(bld)
     build_changelog(bld)
     bld.build_python_version_file()
-    bld.add_group('bokeh', move = False)
     if bld.env.ISPATCH or bld.cmd != "install":
         return
     install_condaenv(bld)
@@ -62,8 +62,30 @@ def build_bokehjs(bld, viewname, key):
         for j in ('ts', 'coffee'):
             srcs.extend(root.glob(f"*/{i.replace('.', '/')}/**/*.{j}"))
 
-    from wafbuilder import copyroot
+    from wafbuilder                  import copyroot
+    from wafbuilder._python._imports import GRAPH as IMPORTS
     tgt  = copyroot(bld, key+'.js')
+    bdir = Path(str(bld.bldnode))
+    if IMPORTS.setup(bdir/"c4che"/"pyimports.json"):
+        bld.add_post_fun(lambda _: IMPORTS.save())
+
+    # the compilation imports the modules, which import others in turn
+    deps = list(mods)
+    for mod in deps:
+        pysrc = [j for i in root.glob(f"*/{mod}") if i.is_dir() for j in i.glob('**/*.py')]
+        for imp in IMPORTS.imports(pysrc, mod):
+            if imp.split('.')[0] not in deps:
+                deps.append(imp.split('.')[0])
+
+    def _waitfor(tgen) -> bool:
+        "the compilation needs the python modules & extensions in the build dir"
+        name = str(getattr(tgen, 'name', ''))
+        if name.endswith(':pyext'):
+            return name[:-len(':pyext')] in deps
+        if name.endswith(':copying'):
+            path = Path(str(tgen.target[0]))
+            return bdir in path.parents and path.relative_to(bdir).parts[0] in deps
+        return False
 
     rule = f'{bld.env["PYTHON"][0]} {__file__} '+' '.join(modules)+' -o ${TGT} -k '+key
     bld(
@@ -73,7 +95,8 @@ def build_bokehjs(bld, viewname, key):
         rule         = rule,
         target       = tgt,
         cls_keyword  = lambda _: 'Bokeh',
-        group        = 'bokeh',
+        features     = 'waitfor',
+        waitfor      = _waitfor,
         **bld.installcodepath()
     )
 
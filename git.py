@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 u"git extraction functions"
-from   typing import Any # pylint: disable=unused-import
+from   typing import Any, List, Optional # pylint: disable=unused-import
+from   functools import lru_cache
 from   pathlib import Path
 import os
 import subprocess
@@ -69,3 +70,24 @@ def isdirty(path = None) -> bool:
     u"returns whether we're sitting in-between tags"
     vers = version(path)
     return vers[-1] == '+' if vers else False
+
+@lru_cache(maxsize = None)
+def changes(rev: str) -> Optional[List[Path]]:
+    u"""
+    returns the files changed since the merge base with *rev*, uncommitted and
+    untracked files included, or None if git fails
+    """
+    def _run(*args) -> List[str]:
+        out = subprocess.check_output(('git',)+args, stderr = subprocess.DEVNULL)
+        return [i for i in out.decode('utf-8').split('\n') if i.strip()]
+
+    try:
+        root  = Path(_run('rev-parse', '--show-toplevel')[0])
+        base  = _run('merge-base', rev, 'HEAD')[0]
+        files = (
+            _run('diff', '--name-only', base)
+            + _run('ls-files', '--others', '--exclude-standard', '--full-name')
+        )
+    except (OSError, IndexError, subprocess.CalledProcessError):
+        return None
+    return [(root/i).resolve() for i in files]
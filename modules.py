@@ -77,8 +77,40 @@ class Modules:
         mods  = ('/'+i.split('/')[-1] for i in self(bld))
         names = (path for path in bld.path.ant_glob((root+'/*test.py', root+'/*/*test.py')))
         names = (str(name) for name in names if any(i in str(name) for i in mods))
+        if getattr(bld.options, 'TEST_IMPACTED', None):
+            from wafbuilder._python._impacted import impacted
+            names = list(names)
+            found = impacted(bld, names, bld.options.TEST_IMPACTED)
+            if found is not None:
+                names = [i for i in names if Path(i).resolve() in found]
         getattr(wafbuilder, 'runtest')(bld, *(name[name.rfind('tests'):] for name in names))
 
+    def run_includes(self, bld):
+        "prints the c++ include graph costs"
+        from wafbuilder._cppincludes import includes
+        includes(bld, self(bld))
+
+    def run_bench(self, bld):
+        "runs the c++ benchmarks"
+        from wafbuilder._cppbench import bench
+        bench(bld, self(bld))
+
+    def run_cpptest(self, bld):
+        "runs the gtests"
+        from wafbuilder._cpptest import cpptest
+        cpptest(bld, self(bld))
+
+    def run_vecreport(self, bld):
+        "reports the loops which were not vectorized"
+        from wafbuilder._cppvecreport import vecreport
+        vecreport(bld, self(bld))
+
+    @staticmethod
+    def run_profile(bld):
+        "profiles a program: waf profile -- cmd args"
+        from wafbuilder._profile import profile
+        profile(bld)
+
     def run_build(self, bld, mods = None):
         "compile sources"
         if mods is None:
@@ -145,16 +177,36 @@ class Modules:
             fun = cmd = 'requirements'
         class _Test(BuildContext):
             fun = cmd = 'test'
+        class _Includes(BuildContext):
+            fun = cmd = 'includes'
+        class _Bench(BuildContext):
+            fun = cmd = 'bench'
+        class _CppTest(BuildContext):
+            fun = cmd = 'cpptest'
+        class _Profile(BuildContext):
+            fun = cmd = 'profile'
+        class _VecReport(BuildContext):
+            fun = cmd = 'vecreport'
 
         return dict(_CondaEnvName = _CondaEnvName,
                     _Requirements = _Requirements,
                     _Test         = _Test,
+                    _Includes     = _Includes,
+                    _Bench        = _Bench,
+                    _CppTest      = _CppTest,
+                    _Profile      = _Profile,
+                    _VecReport    = _VecReport,
                     requirements  = self.run_requirements,
                     condaenvname  = self.run_condaenvname,
                     options       = self.run_options,
                     configure     = self.run_configure,
                     build         = self.run_build,
-                    test          = self.run_tests)
+                    test          = self.run_tests,
+                    includes      = self.run_includes,
+                    bench         = self.run_bench,
+                    cpptest       = self.run_cpptest,
+                    profile       = self.run_profile,
+                    vecreport     = self.run_vecreport)
 
     def addbuild(self, locs, simple = False):
         "adds build methods"